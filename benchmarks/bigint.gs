@@ -0,0 +1,3 @@
+# Big integer arithmetic: a large power and a factorial
+1{3*}20000*1000%
+1 2000,{)*}/1000%
@@ -0,0 +1,3 @@
+# Recursion through a named block: naive Fibonacci
+{.2<{}{.(f\((f+}if}:f;
+18f
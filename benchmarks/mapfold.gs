@@ -0,0 +1,3 @@
+# Map and fold over large lists
+50000,{.*}%{+}*
+100000,{7%}%{+}*
@@ -0,0 +1,2 @@
+# Deeply nested blocks
+0{{{{)}4*}4*}4*}200*
@@ -0,0 +1,2 @@
+# Trial division sieve, counts the primes below 400
+400,3>{:n;n,2>{n\%!},!},,)
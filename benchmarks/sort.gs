@@ -0,0 +1,2 @@
+# Sort a scrambled list
+20000,{7919*65536%}%$-1=
@@ -0,0 +1,2 @@
+# Build a long string one piece at a time, then split it
+""{"ab"+}20000*"a"%,
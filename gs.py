@@ -1,22 +1,68 @@
 import gs_interpreter
-import gs_debugger
+import gs_memo
+import gs_output
+import gs_profile
+import gs_values
 
+import argparse
 import sys
 
-from curses import wrapper
-
 def run_debugger(txt):
+    import gs_debugger
+    from curses import wrapper
     wrapper(gs_debugger.main, txt)
 
-def run(txt):
-    interpreter = gs_interpreter.Interpreter(txt)
+#What is left on the stack is written out at the end
+def run(txt, stdin=None, output=None, profile=None, memo=None):
+    interpreter = gs_interpreter.Interpreter(txt, stdin=stdin, output=output, optimise=True)
+    interpreter.profile = profile
+    if memo is not None:
+        memo.attach(interpreter)
     result = interpreter.execute()
-    print(result)
+    interpreter.output.write_result(result)
+    interpreter.output.flush()
 
+#Like GolfScript, all of stdin is the string on the stack when the program
+#starts. Nothing is read from a terminal
+def read_input(path=None):
+    if path is not None:
+        with open(path, "rb") as f:
+            return gs_values.read_text(f)
 
-if __name__ == "__main__":
-    with open("test.gs","r") as f:
+    if sys.stdin is None or sys.stdin.isatty():
+        return ""
+    return gs_values.read_text(sys.stdin.buffer)
+
+def write_profile(profile, json_path, collapsed_path):
+    if json_path:
+        with open(json_path, "w") as f:
+            profile.dump_json(f)
+    if collapsed_path:
+        with open(collapsed_path, "w") as f:
+            f.write(profile.collapsed())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a GolfScript program")
+    parser.add_argument("program", nargs="?", help="program to run, without one test.gs is opened in the debugger")
+    parser.add_argument("-i", "--input", help="read input from this file instead of stdin")
+    parser.add_argument("-d", "--debug", action="store_true", help="open the program in the debugger")
+    parser.add_argument("-b", "--binary", action="store_true", help="write output as utf8 bytes")
+    parser.add_argument("--buffer-size", type=int, default=gs_output.BUFFER_SIZE, help="characters of output to collect before writing")
+    parser.add_argument("--profile", help="write a JSON profile of the run to this file")
+    parser.add_argument("--collapsed", help="write the profile as collapsed stacks for flamegraph tools to this file")
+    parser.add_argument("--memo", type=int, nargs="?", const=gs_memo.MEMO_SIZE, help="memoise pure named blocks, keeping this many results")
+    args = parser.parse_args(argv)
+
+    with open(args.program or "test.gs", "r") as f:
         txt = f.read()
+
+    if args.debug or args.program is None:
         run_debugger(txt)
+    else:
+        profile = gs_profile.Profile() if args.profile or args.collapsed else None
+        memo = gs_memo.Memo(args.memo) if args.memo else None
+        run(txt, read_input(args.input), gs_output.Output(buffer_size=args.buffer_size, binary=args.binary), profile, memo)
+        write_profile(profile, args.profile, args.collapsed)
 
-        
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+from gs_codeblock import CodeBlock
+import gs_interpreter
+import gs_output
+
+#Set in each worker by init_worker. The shared program is parsed once per
+#worker and every job on that worker runs a frame of it
+program = None
+limits = None
+
+def init_worker(text, job_limits):
+    global program, limits
+    program = CodeBlock(text, optimise=True) if text is not None else None
+    limits = job_limits
+
+#A job is (index, name, text, stdin). text is None to run the shared program
+def run_job(job):
+    index, name, text, stdin = job
+    result = {"job": index, "name": name}
+    result.update(run_program(program if text is None else text, stdin, limits))
+    return result
+
+#Run one program, capturing what it prints, and describe how it went
+def run_program(code, stdin=None, job_limits=None):
+    result = {}
+    output = gs_output.capture()
+    interpreter = None
+    start = time.perf_counter()
+
+    try:
+        interpreter = gs_interpreter.Interpreter(code, limits=job_limits, stdin=stdin, output=output, optimise=True)
+        output.write_result(interpreter.execute())
+        result["status"] = "ok"
+    except gs_interpreter.LimitExceeded as e:
+        result["status"] = "limit"
+        result["error"] = str(e)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+
+    result["output"] = output.getvalue()
+    result["steps"] = interpreter.steps if interpreter else 0
+    result["time"] = time.perf_counter() - start
+    return result
+
+#Run jobs over a pool of processes, yielding results as they finish
+def run_batch(jobs, program_text=None, job_limits=None, processes=None, chunksize=1):
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(program_text, job_limits)) as pool:
+        yield from pool.imap_unordered(run_job, jobs, chunksize)
+
+def read_file(path):
+    with open(path, "r") as f:
+        return f.read()
+
+def file_jobs(paths):
+    for index, path in enumerate(paths):
+        yield (index, path, read_file(path), None)
+
+def input_jobs(paths):
+    for index, path in enumerate(paths):
+        yield (index, path, None, read_file(path))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many GolfScript programs, or one program on many inputs, printing a JSON line per job")
+    parser.add_argument("files", nargs="+", help="programs to run, or inputs when --program is given")
+    parser.add_argument("-p", "--program", help="program to run on every input file")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--chunksize", type=int, default=1)
+    parser.add_argument("--max-steps", type=int)
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--max-stack", type=int)
+    parser.add_argument("--max-call-depth", type=int)
+    parser.add_argument("--max-memory", type=int)
+    args = parser.parse_args(argv)
+
+    job_limits = gs_interpreter.Limits(
+        max_steps=args.max_steps,
+        timeout=args.timeout,
+        max_stack=args.max_stack,
+        max_call_depth=args.max_call_depth,
+        max_memory=args.max_memory,
+    )
+
+    if args.program:
+        program_text = read_file(args.program)
+        jobs = input_jobs(args.files)
+    else:
+        program_text = None
+        jobs = file_jobs(args.files)
+
+    for result in run_batch(jobs, program_text, job_limits, args.jobs, args.chunksize):
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
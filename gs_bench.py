@@ -0,0 +1,104 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import gs_interpreter
+import gs_output
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+THRESHOLD = 0.25
+
+#Time a program over a few runs, keeping the fastest, then run it once more
+#under tracemalloc for its peak memory
+def measure(txt, repeat=3):
+    wall_time = None
+    for _ in range(repeat):
+        interpreter = gs_interpreter.Interpreter(txt, output=gs_output.capture(), optimise=True)
+        start = time.perf_counter()
+        interpreter.execute()
+        elapsed = time.perf_counter() - start
+        wall_time = elapsed if wall_time is None else min(wall_time, elapsed)
+
+    tracemalloc.start()
+    try:
+        gs_interpreter.Interpreter(txt, output=gs_output.capture(), optimise=True).execute()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "steps" : interpreter.steps,
+        "wall_time" : wall_time,
+        "steps_per_sec" : interpreter.steps / wall_time if wall_time else 0.0,
+        "peak_memory" : peak_memory,
+    }
+
+def run_benchmarks(paths, repeat=3):
+    results = {}
+    for path in paths:
+        with open(path, "r") as f:
+            txt = f.read()
+        results[os.path.splitext(os.path.basename(path))[0]] = measure(txt, repeat)
+    return results
+
+#Names of the results that are more than threshold slower or bigger than the baseline
+def compare(results, baseline, threshold=THRESHOLD):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ("wall_time", "peak_memory"):
+            if result[key] > baseline[name][key] * (1 + threshold):
+                regressions.append((name, key, baseline[name][key], result[key]))
+    return regressions
+
+def report(results, baseline, out=sys.stdout):
+    out.write("{:<12}{:>12}{:>12}{:>14}{:>14}{:>10}\n".format("benchmark", "steps", "wall (s)", "steps/sec", "peak (KB)", "change"))
+    for name, result in results.items():
+        change = ""
+        if name in baseline:
+            change = "{:+.0%}".format(result["wall_time"] / baseline[name]["wall_time"] - 1)
+        out.write("{:<12}{:>12}{:>12.4f}{:>14.0f}{:>14}{:>10}\n".format(
+            name, result["steps"], result["wall_time"], result["steps_per_sec"], result["peak_memory"] // 1024, change))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark workloads and compare them with a baseline")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown or growth, 0.25 is 25%%")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--update", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args(argv)
+
+    if args.names:
+        paths = [os.path.join(BENCHMARK_DIR, name + ".gs") for name in args.names]
+    else:
+        paths = sorted(glob.glob(os.path.join(BENCHMARK_DIR, "*.gs")))
+
+    results = run_benchmarks(paths, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    report(results, baseline)
+
+    if args.update:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, key, expected, actual in regressions:
+        print("{}: {} went from {:.4g} to {:.4g}".format(name, key, expected, actual))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
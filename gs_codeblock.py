@@ -1,7 +1,23 @@
 import copy
+import re
+import gs_optimise
+
+string_pattern = re.compile(r"(['\"])((?:\\.|(?!\1).)*)(\1?)", re.S)
+
+escapes = {
+    'n' : '\n',
+    't' : '\t',
+    'r' : '\r',
+    's' : ' ',
+    'a' : '\a',
+    'b' : '\b',
+    'e' : '\x1b',
+    'f' : '\f',
+    'v' : '\v',
+    '0' : '\0',
+}
 
 def tokenise(txt,dbg=0):
-    import re
     pattern = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*|'(?:\\.|[^'])*'?|\"(?:\\.|[^\"])*\"?|-?[0-9]+|#[^\n\r]*|.")
 
     tokens = []
@@ -22,8 +38,102 @@ def tokenise(txt,dbg=0):
 
     return (result,txt_index)
 
+#A number or string token decoded once when the block is compiled. Any
+#token can be assigned to, so once one that looks like a literal has been
+#the interpreter resolves these by name the same way as a Symbol
+class Literal:
+    def __init__(self, token, value):
+        self.token = token
+        self.value = value
+        self.name = token
+        self.parts = None
+        self.names = (token,)
+        self.symbols = None
+        self.version = -1
+        self.handler = None
+
+    def __str__(self):
+        return self.token
+
+    def __repr__(self):
+        return self.token
+
+#A name token, caches what it resolved to until that name is assigned again.
+#The optimiser makes these with parts, the instructions they stand for
+class Symbol:
+    def __init__(self, name, parts=None):
+        self.name = name
+        self.parts = parts
+        if parts is None:
+            self.names = (name,)
+        else:
+            self.names = tuple({part.name for part in parts if type(part) is Symbol or type(part) is Literal})
+        self.symbols = None
+        self.version = -1
+        self.handler = None
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+def unescape(token):
+    quote, body, closing = string_pattern.match(token).groups()
+
+    if quote == '\'':
+        return re.sub(r"\\([\\'])", r"\1", body)
+
+    return re.sub(r"\\(.)", lambda m: escapes.get(m.group(1), m.group(1)), body, flags=re.S)
+
+def is_string(token):
+    return token[0] == '\'' or token[0] == '\"'
+
+def is_number(token):
+    return token[-1].isdigit() and (token[0] == '-' or token[0].isdigit())
+
+def decode_token(token):
+    if is_string(token):
+        return Literal(token, unescape(token))
+    elif is_number(token):
+        return Literal(token, int(token))
+    else:
+        return Symbol(token)
+
+#Resolve every brace pair in one pass, nested blocks become ready made CodeBlocks
+def compile_blocks(tokens, txt_index, optimise=False):
+    root = ([], [])
+    current = root
+    open_blocks = []
+
+    for index,token in enumerate(tokens):
+        if token == '{':
+            open_blocks.append((index, current))
+            current = ([], [])
+        elif token == '}' and open_blocks:
+            start, parent = open_blocks.pop()
+            block_tokens = (tokens[start+1:index], txt_index[start+1:index])
+            if optimise:
+                current = gs_optimise.optimise(current)
+            parent[0].append(CodeBlock(block_tokens, instructions=current))
+            parent[1].append(txt_index[start])
+            current = parent
+        else:
+            current[0].append(decode_token(token))
+            current[1].append(txt_index[index])
+
+    #Unmatched brace, the outermost one is the first to be reached
+    if open_blocks:
+        start, parent = open_blocks[0]
+        parent[0].append(MissingBracket())
+        parent[1].append(txt_index[start])
+
+    if optimise:
+        return gs_optimise.optimise(root)
+    return root
+
 class CodeBlock:
-    def __init__(self,tokens, immediate=False):
+    def __init__(self,tokens, immediate=False, instructions=None, optimise=False):
         
         self.immediate = immediate
         if isinstance(tokens, str):
@@ -31,6 +141,10 @@ class CodeBlock:
         else:
             self.tokens,self.txt_index = tokens
 
+        if instructions is None:
+            instructions = compile_blocks(self.tokens, self.txt_index, optimise)
+
+        self.instructions,self.instructions_index = instructions
 
         self.ip = 0
 
@@ -43,37 +157,30 @@ class CodeBlock:
     def __add__(self, other):
         return CodeBlock((self.tokens + other.tokens, self.txt_index + other.txt_index))
 
-    def get_next_item(self, top):
+    #Blocks are shared values and never modified, frames and loops work on shallow copies
+    def frame(self, immediate=None):
+        block = self.fork()
+        if immediate is not None:
+            block.immediate = immediate
+        return block
 
-        if self.ip >= len(self.tokens):
-            return None
+    #A copy of a running frame that carries on independently of this one
+    def fork(self):
+        return copy.copy(self)
 
-        current_token = self.tokens[self.ip]
+    def append_pop(self):
+        tokens = (self.tokens + [';'], self.txt_index + [None])
+        instructions = (self.instructions + [decode_token(';')], self.instructions_index + [None])
+        return CodeBlock(tokens, True, instructions)
 
-        if current_token == '{':
-            return self.find_block()
-        else:
-            self.ip += 1
-            return current_token
+    def get_next_item(self, top):
 
-    def find_block(self):
-        bracket_count = 0
+        if self.ip >= len(self.instructions):
+            return None
 
-        for i,v in enumerate(self.tokens[self.ip:]):
-            if v == '{':
-                bracket_count += 1
-            elif v == '}':
-                bracket_count -= 1
-            
-            if bracket_count == 0:
-                min_idx = self.ip+1
-                max_idx = self.ip+i
-                tokens = (self.tokens[min_idx:max_idx], self.txt_index[min_idx:max_idx])
-                block = CodeBlock(tokens)
-                self.ip += i + 1
-                return block
-
-        raise Exception("Missing Bracket")
+        item = self.instructions[self.ip]
+        self.ip += 1
+        return item
 
     def get_ip(self):
         return self.ip
@@ -82,9 +189,9 @@ class CodeBlock:
         self.ip = ip
 
     def get_current_instruction(self):
-        if self.ip >= len(self.tokens):
+        if self.ip >= len(self.instructions):
             return None
-        return self.txt_index[self.ip]
+        return self.instructions_index[self.ip]
 
     def __str__(self):
         return '{' + ''.join(self.tokens) + '}'
@@ -100,13 +207,30 @@ class CodeBlock:
         ]
         return obj
 
+open_bracket = CodeBlock('[', True)
+close_bracket = CodeBlock(']', True)
+pop_block = CodeBlock(';', True)
+
+#Placeholder for a '{' without a matching '}', only fails once it is reached
+class MissingBracket(CodeBlock):
+    def __init__(self):
+        self.immediate = True
+        self.ip = 0
+
+    def get_next_item(self, top):
+        raise Exception("Missing Bracket")
+
+    def get_current_instruction(self):
+        return None
+
+    def __str__(self):
+        return "MissingBracket"
+
 class For(CodeBlock):
     def __init__(self, code : CodeBlock, number : int):
         self.max = number
         self.number = number
-        self.code = copy.deepcopy(code)
-
-        self.code.immediate = True
+        self.code = code.frame(True)
 
     def get_next_item(self,top):
         if self.number > 0:
@@ -135,12 +259,13 @@ class For(CodeBlock):
         return obj
 
 
+#Loops walk the shared list with an index and never modify it
 class ForEach(CodeBlock):
     def __init__(self, code : CodeBlock, item : list, pop = 1):
         self.item = item
+        self.index = 0
         self.max = len(item)
-        self.code = copy.deepcopy(code)
-        self.code.immediate = True
+        self.code = code.frame(True)
         
         self.fold = False
         self.push_code = False
@@ -148,7 +273,15 @@ class ForEach(CodeBlock):
         self.pop = pop
 
     def get_ip(self):
-        return self.max - len(self.item)
+        return self.index
+
+    def next_value(self):
+        value = self.item[self.index]
+        self.index += 1
+        return value
+
+    def remaining(self):
+        return self.item[self.index:]
 
     def set_ip(self,ip):
         pass
@@ -157,16 +290,16 @@ class ForEach(CodeBlock):
         if self.push_code:
             self.push_code = False
             return self.code
-        elif len(self.item) > 0:
+        elif self.index < self.max:
             if self.popped >= self.pop:
                 self.push_code = True
             self.popped += 1
-            return self.item.pop(0)
+            return self.next_value()
         else:
             return None
 
     def __str__(self):
-        return "ForEachBlock: {}".format(self.item)
+        return "ForEachBlock: {}".format(self.remaining())
 
     def get_current_instruction(self):
         return None
@@ -174,7 +307,7 @@ class ForEach(CodeBlock):
     def get_registers(self):
         obj = [
             ("code", self.code),
-            ("items", self.item),
+            ("items", self.remaining()),
             ("pushing_code", self.push_code),
             ("fold",self.fold)
         ]
@@ -185,17 +318,17 @@ class ForEachFold(ForEach):
         if self.push_code:
             self.push_code = False
             return self.code
-        elif len(self.item) > 0:
+        elif self.index < self.max:
             self.push_code = True
-            return self.item.pop(0)
+            return self.next_value()
         elif not self.fold:
             self.fold = True
-            return CodeBlock(']', True)
+            return close_bracket
         else:
             return None
 
     def __str__(self):
-        return "ForEachFold: {}".format(self.item)
+        return "ForEachFold: {}".format(self.remaining())
 
     def get_current_instruction(self):
         return None
@@ -217,6 +350,20 @@ class ComplexCodeBlock(CodeBlock):
     def get_current_instruction(self):
         return None
 
+    #The step lists are consumed as the frame runs and can hold methods
+    #bound to it, so the copy gets its own lists bound to itself
+    def fork(self):
+        block = copy.copy(self)
+        block.start = [block.rebind(f) for f in self.start]
+        block.sequence = None if self.sequence is None else [block.rebind(f) for f in self.sequence]
+        block.end = [block.rebind(f) for f in self.end]
+        return block
+
+    def rebind(self, f):
+        if isinstance(getattr(f, "__self__", None), CodeBlock):
+            return getattr(self, f.__name__)
+        return f
+
     def get_next_item(self,top):
         if self.start:
             return self.start.pop(0)(top)
@@ -241,7 +388,7 @@ class ComplexCodeBlock(CodeBlock):
     def get_registers(self):
         obj = [
             ("code", self.code),
-            ("items", self.item),
+            ("items", self.remaining()),
             ("start_code", self.start),
             ("sequence_code", self.sequence),
             ("sequence_ptr",self.ip),
@@ -255,18 +402,23 @@ class ComplexCodeBlock(CodeBlock):
 #Map the code onto the list keeping the list
 class Map(ComplexCodeBlock):
     def __init__(self, code : CodeBlock,item : list):
-        self.code = copy.deepcopy(code)
-        self.code.immediate = True
-        self.item = copy.deepcopy(item)
+        self.code = code.frame(True)
+        self.item = item
+        self.index = 0
 
-        start = [lambda top : CodeBlock('[', True)]
+        start = [lambda top : open_bracket]
         sequence = [self.pop_list,self.map_code]
-        end = [lambda top : CodeBlock(']', True)]
+        end = [lambda top : close_bracket]
         super().__init__(start,sequence,end)
 
+    def remaining(self):
+        return self.item[self.index:]
+
     def pop_list(self,top):
-        if self.item:
-            return self.item.pop(0)
+        if self.index < len(self.item):
+            value = self.item[self.index]
+            self.index += 1
+            return value
         return None
 
     def map_code(self,top):
@@ -278,7 +430,6 @@ class Map(ComplexCodeBlock):
 class MapCondition(Map):
     def __init__(self, code : CodeBlock, item : list):
         super().__init__(code, item)
-        self.original = copy.deepcopy(item)
 
         self.end.append(self.examine_conditions)
         self.end.append(self.swap)
@@ -287,10 +438,10 @@ class MapCondition(Map):
         self.new_arr = []
         for i,v in enumerate(top):
             if v:
-                self.new_arr.append(self.original[i])
+                self.new_arr.append(self.item[i])
 
         #Pop the old array
-        return CodeBlock(';', True)
+        return pop_block
 
     def swap(self, top):
         return self.new_arr
@@ -302,9 +453,7 @@ class MapCondition(Map):
 
 class Do(CodeBlock):
     def __init__(self,code : CodeBlock):
-        self.code = copy.deepcopy(code)
-        self.code.tokens += ';' #add pop
-        self.code.immediate = True
+        self.code = code.append_pop()
 
     def get_next_item(self,top):
         if top:
@@ -332,15 +481,10 @@ class Do(CodeBlock):
 
 class WhileBlock(CodeBlock):
     def __init__(self,condition : CodeBlock,code : CodeBlock):
-        self.condition = copy.deepcopy(condition)
-        self.code = copy.deepcopy(code)
+        self.condition = condition.append_pop()
+        self.code = code.frame(True)
         self.is_condition = True
 
-        self.condition.tokens += ';' #add pop
-
-        self.code.immediate = True
-        self.condition.immediate = True
-
     def get_ip(self):
         return 0
 
@@ -13,6 +13,7 @@ class Debugger:
         self.screen = screen
         
         self.interpreter = gs_interpreter.Interpreter(txt)
+        self.interpreter.tail_calls = False
         self.txt = txt
 
         self.running = False
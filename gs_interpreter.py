@@ -3,89 +3,289 @@ import collections.abc
 from gs_codeblock import *
 from gs_operator import *
 import copy
+import gs_output
+import gs_profile
+import gs_utils
+import sys
+import time
+
+STACK_SIZE = 500
+MAX_STACK_SIZE = 1 << 24
+CHECK_INTERVAL = 1000
+
+#Events hooks can be added for, each hook is called as hook(interpreter, ...)
+#  instruction (item)             before an item runs
+#  operator    (name, function)   before a builtin operator function runs
+#  push_frame  (frame)            after a frame is pushed on the call stack
+#  pop_frame   (frame)            after a finished frame is popped
+#  assign      (name, value)      after a name is assigned with :
+#  print       (value)            before a value is printed
+HOOK_EVENTS = ("instruction", "operator", "push_frame", "pop_frame", "assign", "print")
+
+#Raised when a program goes over one of its limits. Carries what the
+#program had done so far so callers can report or inspect it
+class LimitExceeded(Exception):
+    def __init__(self, kind, value, limit, interpreter):
+        super().__init__("{} limit exceeded: {} is over the limit of {}".format(kind, value, limit))
+        self.kind = kind
+        self.value = value
+        self.limit = limit
+        self.stack = interpreter.stack[:interpreter.sp+1]
+        self.steps = interpreter.steps
+        self.call_depth = len(interpreter.call_stack)
+
+class StackOverflowError(LimitExceeded):
+    def __init__(self, size, limit, interpreter):
+        super().__init__("stack", size, limit, interpreter)
+        self.size = size
+
+#Limits for a run, None means unlimited. Steps, time and memory are only
+#checked every check_interval steps so the run loop stays fast
+class Limits:
+    def __init__(self, max_steps=None, timeout=None, max_stack=None, max_call_depth=None, max_memory=None, check_interval=CHECK_INTERVAL):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_stack = max_stack
+        self.max_call_depth = max_call_depth
+        self.max_memory = max_memory
+        self.check_interval = check_interval
+
+#Every assignment bumps version and stamps the name with it, so a cached
+#lookup only has to be redone when its own name was assigned since.
+#literals is set once a number or string token has been assigned to,
+#until then literals just push their value
+class SymbolTable(dict):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = 0
+        self.versions = {}
+        self.literals = False
+
+    def __setitem__(self, name, value):
+        self.version += 1
+        self.versions[name] = self.version
+        if isinstance(name, str) and name and (is_string(name) or is_number(name)):
+            self.literals = True
+        super().__setitem__(name, value)
+
+    def copy(self):
+        symbols = SymbolTable(self)
+        symbols.version = self.version
+        symbols.versions = dict(self.versions)
+        symbols.literals = self.literals
+        return symbols
+
+#The state of an Interpreter at one point. Values are never modified in
+#place so the stack and symbols only copy references
+class Snapshot:
+    def __init__(self, interpreter):
+        self.stack = interpreter.stack[:interpreter.sp+1]
+        self.bracket_stack = list(interpreter.bracket_stack)
+        self.symbols = interpreter.symbols.copy()
+        self.call_stack = [frame.fork() for frame in interpreter.call_stack]
+        self.steps = interpreter.steps
+
+def ignore(interpreter):
+    pass
+
+#Built once and shared by every Interpreter, each starts from its own copy
+BUILTINS = {
+    "~" : op_bit_not,
+    "`" : op_str,
+    "!" : op_not,
+    "@" : op_rot,
+    "$" : op_cmv, #partial
+    "+" : op_add,
+    "-" : op_sub,
+    "*" : op_mul,
+    "/" : op_div,
+    "%" : op_mod,
+    "|" : op_bit_or,
+    "&" : op_bit_and,
+    "^" : op_bit_xor,
+    "[" : op_opb,
+    "]" : op_clb,
+    "\\": op_swp,
+    ":" : op_asn,
+    ";" : op_pop,
+    "<" : op_lt,
+    ">" : op_gt,
+    "=" : op_eq,
+    "," : op_arr, #partial
+    "." : op_dup,
+    "?" : op_pow, #partial
+    "(" : op_dec,
+    ")" : op_inc,
+    "and" : CodeBlock("1$if"),
+    "or"  : CodeBlock("1$\\if"),
+    "xor" : CodeBlock("\\!!{!}*"),
+    "print" : op_print,
+    "p" : CodeBlock("`puts"),
+    "n" : "\n",
+    "puts" : CodeBlock("print n print"),
+    "rand" : op_rand,
+    "do" : op_do,
+    "while" : op_while,
+    "until" : op_until,
+    "if"    : op_if,
+    "abs"   : op_abs,
+    "zip"   : op_zip,
+    "base"  : op_base,
+}
 
 class Interpreter:
-    def __init__(self, txt):
-        code = CodeBlock(txt)
+    #txt can also be an already parsed CodeBlock, which is shared rather than
+    #parsed again. stdin, if given, is pushed as a string before the program runs.
+    #Printing goes to output, an Output on stdout unless one is given.
+    #optimise runs the peephole optimiser over the program, see gs_optimise
+    def __init__(self, txt, max_stack=MAX_STACK_SIZE, limits=None, stdin=None, output=None, optimise=False):
+        if isinstance(txt, CodeBlock):
+            code = txt.frame()
+        else:
+            code = CodeBlock(txt, optimise=optimise)
         self.call_stack = [code]
+        self.optimise = optimise
+
+        self.output = output if output is not None else gs_output.Output()
+        self.limits = limits
+        self.deadline = None
+        self.max_call_depth = sys.maxsize
+        if limits is not None:
+            if limits.max_stack is not None:
+                max_stack = limits.max_stack
+            if limits.max_call_depth is not None:
+                self.max_call_depth = limits.max_call_depth
 
-        self.stack = [None]*500
+        self.stack = [None]*STACK_SIZE
         self.sp = -1
+        self.max_stack = max_stack
+        self.high_water = 0
+        self.stack_limit = 0
+        self.shrink_at = -1
         self.bracket_stack = []
 
-        self.symbols = {
-            "~" : op_bit_not,
-            "`" : op_str,
-            "!" : op_not,
-            "@" : op_rot,
-            "$" : op_cmv, #partial
-            "+" : op_add,
-            "-" : op_sub,
-            "*" : op_mul,
-            "/" : op_div,
-            "%" : op_mod,
-            "|" : op_bit_or,
-            "&" : op_bit_and,
-            "^" : op_bit_xor,
-            "[" : op_opb,
-            "]" : op_clb,
-            "\\": op_swp,
-            ":" : op_asn,
-            ";" : op_pop,
-            "<" : op_lt,
-            ">" : op_gt,
-            "=" : op_eq,
-            "," : op_arr, #partial
-            "." : op_dup,
-            "?" : op_pow, #partial
-            "(" : op_dec,
-            ")" : op_inc,
-            "and" : CodeBlock("1$if"),
-            "or"  : CodeBlock("1$\\if"),
-            "xor" : CodeBlock("\\!!{!}*"),
-            "print" : op_print,
-            "p" : CodeBlock("`puts"),
-            "n" : "\n",
-            "puts" : CodeBlock("print n print"),
-            "rand" : op_rand,
-            "do" : op_do,
-            "while" : op_while,
-            "until" : op_until,
-            "if"    : op_if,
-            "abs"   : op_abs,
-            "zip"   : op_zip,
-            "base"  : op_base, #partial
-        }
-
-        self.default_symbols = copy.deepcopy(self.symbols)
+        self.steps = 0
+        self.breakpoints = set()
+        #A gs_profile.Profile while profiling, the plain run loop is used without one
+        self.profile = None
+        #Event name to the hooks added for it, also only looked at outside the plain run loop
+        self.hooks = {}
+        #Debuggers turn this off so stepping over a call in tail position
+        #still sees the caller's frame
+        self.tail_calls = True
+
+        self.symbols = SymbolTable(BUILTINS)
+
+        self.default_symbols = BUILTINS
+
+        if stdin is not None:
+            self.push(stdin)
 
     def stack_frame(self):
         return self.call_stack[-1]
 
+    #A call made from the end of a plain block replaces that block's frame,
+    #so recursion in tail position runs in constant space. Frames are left
+    #alone while hooks, a profile or a debugger are watching them
     def call(self,block):
-        new_block = copy.deepcopy(block)
-
-        if isinstance(new_block, CodeBlock):
-            self.call_stack.append(new_block)
+        if isinstance(block, CodeBlock):
+            frame = block.frame()
         else:
-            self.call_stack.append(CodeBlock(str(new_block)))
+            frame = CodeBlock(str(block))
+
+        if self.call_stack and self.tail_calls and not self.hooks and self.profile is None and self.is_finished(self.call_stack[-1]):
+            self.call_stack[-1] = frame
+            return
+
+        if len(self.call_stack) >= self.max_call_depth:
+            raise LimitExceeded("call depth", len(self.call_stack) + 1, self.max_call_depth, self)
+
+        self.call_stack.append(frame)
+
+    #Whether a frame has nothing left to run but whitespace
+    def is_finished(self, frame):
+        if type(frame) is not CodeBlock:
+            return False
+
+        for item in frame.instructions[frame.ip:]:
+            if type(item) is not Symbol or item.parts is not None or not item.name.isspace() or item.name in self.symbols:
+                return False
+        return True
 
     def top(self):
         return self.stack[self.sp]
 
+    #Values are never modified in place so they can be shared without copying
     def push(self, item):
+        if self.sp + 1 >= self.stack_limit:
+            self.grow_stack(self.sp + 2)
         self.sp += 1
-        self.stack[self.sp] = copy.deepcopy(item)
+        self.stack[self.sp] = item
 
-    def push_value(self, item):
-        if not isinstance(item, str):
-            self.push(item)
-        elif str.isnumeric(item.lstrip('-')):
-            self.push(int(item))
-        elif item[0] == '\'' or item[0] == '\"':
-            self.push(item.strip('\'\"'))
+    def push_many(self, items):
+        self.grow_stack(self.sp + 1 + len(items))
+        self.stack[self.sp+1:self.sp+1+len(items)] = items
+        self.sp += len(items)
+
+    #Make room for size items, doubling so pushes stay amortised O(1)
+    def grow_stack(self, size):
+        if size > len(self.stack):
+            if size > self.max_stack:
+                raise StackOverflowError(size, self.max_stack, self)
+
+            new_size = min(max(size, 2*len(self.stack)), self.max_stack)
+            self.stack.extend([None]*(new_size - len(self.stack)))
+            self.shrink_at = len(self.stack) // 4
+
+        self.high_water = max(self.high_water, size)
+        self.stack_limit = min(len(self.stack), self.high_water)
+
+    #Give memory back once a spike has been consumed
+    def shrink_stack(self):
+        new_size = max(STACK_SIZE, len(self.stack) // 2, 2*(self.sp+1))
+        if new_size < len(self.stack):
+            del self.stack[new_size:]
+
+        self.shrink_at = len(self.stack) // 4 if len(self.stack) > STACK_SIZE else -1
+        self.stack_limit = min(len(self.stack), self.high_water)
+
+    #Work out what a name does and cache it on the token
+    def resolve(self, site):
+        symbols = self.symbols
+
+        if site.parts is None:
+            fresh = symbols.versions.get(site.name, 0) <= site.version
         else:
-            pass
+            fresh = all(symbols.versions.get(name, 0) <= site.version for name in site.names)
+
+        if site.symbols is symbols and fresh:
+            site.version = symbols.version
+            return
+
+        if site.parts is not None:
+            #Optimised instructions only keep their shortcut while the names in them are builtins
+            if all(symbols.get(name) is self.default_symbols.get(name) for name in site.names):
+                handler = site.fast
+            else:
+                handler = lambda interpreter: interpreter.execute_parts(site.parts)
+        elif site.name not in symbols:
+            if type(site) is Literal:
+                handler = lambda interpreter: interpreter.push(site.value)
+            else:
+                handler = ignore
+        else:
+            translation = symbols[site.name]
+
+            if callable(translation):
+                handler = translation
+            elif isinstance(translation, CodeBlock):
+                handler = lambda interpreter: interpreter.call(translation)
+            else:
+                handler = lambda interpreter: interpreter.push(translation)
+
+        site.symbols = symbols
+        site.version = symbols.version
+        site.handler = handler
 
     def pop(self):
         self.sp -= 1
@@ -95,34 +295,227 @@ class Interpreter:
         if not self.call_stack:
             return False
 
-        item = self.stack_frame().get_next_item(self.top())
+        self.run(max_steps=1)
+        return True
 
-        if item == None:
-            self.call_stack.pop()
-        else:
-            if isinstance(item,CodeBlock):
-                if item.immediate:
-                    self.call(item)
-                else:
-                    self.push(item)
-            elif isinstance(item, collections.abc.Hashable) and item in self.symbols:
-                translation = self.symbols[item]
-
-                if callable(translation):
-                    translation(self)
-                elif isinstance(translation, CodeBlock):
-                    self.call(translation)
+    #Run until the program is done, max_steps have been executed, a breakpoint
+    #is reached or until(interpreter) is true. Returns why it stopped
+    #Output is flushed whenever it stops
+    def run(self, max_steps=None, until=None):
+        try:
+            if self.limits is None:
+                return self.run_steps(max_steps, until)
+            return self.run_limited(max_steps, until)
+        finally:
+            self.output.flush()
+
+    #Run in chunks of check_interval steps, checking the limits between them
+    def run_limited(self, max_steps, until):
+        limits = self.limits
+        if self.deadline is None and limits.timeout is not None:
+            self.deadline = time.monotonic() + limits.timeout
+
+        while True:
+            chunk = limits.check_interval
+            if limits.max_steps is not None:
+                chunk = min(chunk, limits.max_steps + 1 - self.steps)
+            if max_steps is not None:
+                chunk = min(chunk, max_steps)
+
+            start = self.steps
+            reason = self.run_steps(chunk, until)
+            self.check_limits()
+
+            if max_steps is not None:
+                max_steps -= self.steps - start
+            if reason != "steps" or max_steps == 0:
+                return reason
+
+    def check_limits(self):
+        limits = self.limits
+
+        if limits.max_steps is not None and self.steps > limits.max_steps:
+            raise LimitExceeded("steps", self.steps, limits.max_steps, self)
+
+        if self.deadline is not None:
+            now = time.monotonic()
+            if now > self.deadline:
+                raise LimitExceeded("time", now - self.deadline + limits.timeout, limits.timeout, self)
+
+        if limits.max_memory is not None:
+            size = self.memory_size()
+            if size > limits.max_memory:
+                raise LimitExceeded("memory", size, limits.max_memory, self)
+
+    #Approximate bytes held by the stack and by values assigned to names
+    def memory_size(self):
+        size = gs_utils.approx_items_size(self.stack, self.sp + 1)
+        for name, value in self.symbols.items():
+            if value is not self.default_symbols.get(name) and not callable(value):
+                size += gs_utils.approx_size(value)
+        return size
+
+    def run_steps(self, max_steps, until):
+        if until or self.breakpoints or self.profile is not None or self.hooks:
+            return self.run_checked(max_steps, until)
+
+        call_stack = self.call_stack
+        stack = self.stack
+        symbols = self.symbols
+        limit = -1 if max_steps is None else max_steps
+        steps = 0
+
+        try:
+            while call_stack:
+                if steps == limit:
+                    return "steps"
+                steps += 1
+
+                item = call_stack[-1].get_next_item(stack[self.sp])
+
+                if type(item) is Symbol:
+                    if item.symbols is not symbols or item.version != symbols.version:
+                        self.resolve(item)
+                    item.handler(self)
+                elif type(item) is Literal and not symbols.literals:
+                    self.push(item.value)
+                elif item is None:
+                    call_stack.pop()
                 else:
-                    self.push(translation)
+                    self.execute_item(item)
+        finally:
+            self.steps += steps
+
+        return "done"
+
+    def run_checked(self, max_steps, until):
+        steps = 0
+
+        while self.call_stack:
+            if steps == max_steps:
+                return "steps"
+            if until and until(self):
+                return "until"
+            if steps and self.breakpoints:
+                position = self.get_current_instruction()
+                if position and position[0] in self.breakpoints:
+                    return "breakpoint"
+
+            steps += 1
+            self.steps += 1
+
+            item = self.stack_frame().get_next_item(self.top())
 
+            if item is None:
+                frame = self.call_stack.pop()
+                if self.hooks:
+                    self.emit("pop_frame", frame)
+                if self.profile is not None:
+                    self.profile.frame_popped(self)
+            elif self.profile is not None:
+                self.profile.execute(self, item)
+            elif self.hooks:
+                self.execute_hooked(item)
             else:
-                self.push_value(item)
+                self.execute_item(item)
 
-        return True
+        return "done"
+
+    def add_hook(self, event, hook):
+        if event not in HOOK_EVENTS:
+            raise ValueError("Unknown event {}".format(event))
+        self.hooks.setdefault(event, []).append(hook)
+
+    def remove_hook(self, event, hook):
+        self.hooks[event].remove(hook)
+        if not self.hooks[event]:
+            del self.hooks[event]
+
+    def emit(self, event, *args):
+        for hook in self.hooks.get(event, ()):
+            hook(self, *args)
+
+    #execute_item with the events for it sent to the hooks. Optimised
+    #instructions are run as the instructions they replaced
+    def execute_hooked(self, item):
+        if not self.hooks:
+            self.execute_item(item)
+            return
+
+        if type(item) is Symbol and item.parts is not None:
+            for part in item.parts:
+                self.execute_hooked(part)
+            return
+
+        self.emit("instruction", item)
+        if type(item) is Symbol and "operator" in self.hooks:
+            translation = self.symbols.get(item.name)
+            if callable(translation):
+                self.emit("operator", item.name, translation)
+
+        depth = len(self.call_stack)
+        self.execute_item(item)
+
+        for frame in self.call_stack[depth:]:
+            self.emit("push_frame", frame)
+
+    def execute_parts(self, parts):
+        for part in parts:
+            self.execute_item(part)
+
+    def execute_item(self, item):
+        if type(item) is Symbol or type(item) is Literal and self.symbols.literals:
+            if item.symbols is not self.symbols or item.version != self.symbols.version:
+                self.resolve(item)
+            item.handler(self)
+        elif type(item) is Literal:
+            self.push(item.value)
+        elif isinstance(item,CodeBlock):
+            if item.immediate:
+                self.call(item)
+            else:
+                self.push(item)
+        else:
+            self.push(item)
+
+    def snapshot(self):
+        return Snapshot(self)
+
+    #Go back to a snapshot, which is left as it was so it can be restored again
+    def restore(self, snapshot):
+        self.stack = snapshot.stack + [None]*max(STACK_SIZE, len(snapshot.stack))
+        self.sp = len(snapshot.stack) - 1
+        self.high_water = self.sp + 1
+        self.stack_limit = min(len(self.stack), self.high_water)
+        self.shrink_at = len(self.stack) // 4 if len(self.stack) > STACK_SIZE else -1
+
+        self.bracket_stack = list(snapshot.bracket_stack)
+        self.symbols = snapshot.symbols.copy()
+        self.call_stack = [frame.fork() for frame in snapshot.call_stack]
+        self.steps = snapshot.steps
+
+    #A new Interpreter starting from this one's state. txt, if given, is run
+    #on top of what is left to do here, and stdin is pushed before it. The
+    #fork gets its own output, profile, step count and time limit
+    def fork(self, txt=None, stdin=None, output=None):
+        interpreter = copy.copy(self)
+        interpreter.breakpoints = set(self.breakpoints)
+        interpreter.hooks = {event: list(hooks) for event, hooks in self.hooks.items()}
+        interpreter.restore(self.snapshot())
+        interpreter.output = output if output is not None else gs_output.Output()
+        if self.profile is not None:
+            interpreter.profile = gs_profile.Profile()
+        interpreter.steps = 0
+        interpreter.deadline = None
+
+        if txt is not None:
+            interpreter.call_stack.append(txt.frame() if isinstance(txt, CodeBlock) else CodeBlock(txt, optimise=self.optimise))
+        if stdin is not None:
+            interpreter.push(stdin)
+        return interpreter
 
     def execute(self):
-        while self.call_stack:
-            self.execute_instruction()
+        self.run()
         return self.stack[:self.sp+1]
 
     def done(self):
@@ -0,0 +1,182 @@
+import collections
+
+from gs_codeblock import CodeBlock, Symbol
+from gs_operator import *
+import gs_utils
+
+MEMO_SIZE = 4096
+MAX_ARGUMENTS = 8
+
+#Blocks using any of these are never memoised
+IMPURE_TOKENS = {"print", "p", "puts", "rand", ":"}
+IMPURE_FUNCTIONS = {op_print, op_rand, op_asn}
+
+#How far below the top each operator can read or write. Operators whose
+#reach depends on the stack are worked out in reach()
+REACH = {
+    op_bit_not : 1, op_str : 1, op_not : 1, op_rot : 3, op_cmv : 2,
+    op_add : 2, op_sub : 2, op_mul : 2, op_div : 2, op_mod : 2,
+    op_bit_or : 2, op_bit_and : 2, op_bit_xor : 2,
+    op_opb : 0, op_clb : 0, op_swp : 2, op_asn : 1, op_pop : 1,
+    op_lt : 2, op_gt : 2, op_eq : 2, op_arr : 2, op_dup : 1, op_pow : 2,
+    op_dec : 1, op_inc : 1, op_print : 1, op_rand : 1,
+    op_do : 1, op_while : 2, op_until : 2, op_if : 3,
+    op_abs : 1, op_zip : 1, op_base : 2,
+}
+
+#A memoised block that is running. low is the lowest stack index it has
+#touched so far, everything above it at the start are its arguments
+class Call:
+    def __init__(self, block, interpreter):
+        self.block = block
+        self.depth = len(interpreter.call_stack)
+        self.sp = interpreter.sp
+        self.low = interpreter.sp
+        self.arguments = interpreter.stack[max(0, interpreter.sp + 1 - MAX_ARGUMENTS):interpreter.sp + 1]
+        self.brackets = len(interpreter.bracket_stack)
+        self.version = interpreter.symbols.version
+        self.tainted = False
+
+#Remembers what calls to named blocks left on the stack, keyed by the block,
+#the values it used from the stack and the symbol table version. Only blocks
+#without print, rand or assignment are memoised, and a block that turns out
+#to reach one through another block is dropped. Works through the hooks, so
+#attach() it to an Interpreter to use it
+class Memo:
+    def __init__(self, maxsize=MEMO_SIZE):
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.pure = {}
+        self.arguments = {}
+        self.calls = []
+        self.pending = None
+
+    def attach(self, interpreter):
+        interpreter.add_hook("instruction", self.instruction)
+        interpreter.add_hook("operator", self.operator)
+        interpreter.add_hook("push_frame", self.push_frame)
+        interpreter.add_hook("pop_frame", self.pop_frame)
+
+    def detach(self, interpreter):
+        interpreter.remove_hook("instruction", self.instruction)
+        interpreter.remove_hook("operator", self.operator)
+        interpreter.remove_hook("push_frame", self.push_frame)
+        interpreter.remove_hook("pop_frame", self.pop_frame)
+
+    def is_pure(self, block):
+        if id(block) not in self.pure:
+            self.pure[id(block)] = (block, not any(token in IMPURE_TOKENS for token in block.tokens))
+        return self.pure[id(block)][1]
+
+    def instruction(self, interpreter, item):
+        self.pending = None
+
+        if type(item) is Symbol:
+            translation = interpreter.symbols.get(item.name)
+            if isinstance(translation, CodeBlock) and self.is_pure(translation):
+                self.pending = translation
+
+        #Loop frames look at the top of the stack before handing out an item
+        self.touch(interpreter, 1)
+
+    def operator(self, interpreter, name, function):
+        if not self.calls:
+            return
+
+        call = self.calls[-1]
+        if function in IMPURE_FUNCTIONS or function not in REACH:
+            call.tainted = True
+        elif function is op_clb and len(interpreter.bracket_stack) <= call.brackets:
+            call.tainted = True
+
+        self.touch(interpreter, self.reach(interpreter, function))
+
+    def reach(self, interpreter, function):
+        if function is op_cmv:
+            top = interpreter.top()
+            if isinstance(top, int):
+                return max(1, top + 2)
+            return 2
+        return REACH.get(function, 0)
+
+    def touch(self, interpreter, reach):
+        if self.calls:
+            call = self.calls[-1]
+            call.low = min(call.low, max(-1, interpreter.sp - reach))
+
+    def push_frame(self, interpreter, frame):
+        block = self.pending
+        self.pending = None
+        if block is None:
+            return
+
+        result = self.lookup(interpreter, block)
+        if result is None:
+            self.misses += 1
+            self.calls.append(Call(block, interpreter))
+            return
+
+        count, outputs = result
+        self.hits += 1
+        interpreter.call_stack.pop()
+        self.touch(interpreter, count)
+        interpreter.sp -= count
+        interpreter.push_many(list(outputs))
+
+    def lookup(self, interpreter, block):
+        for count in self.arguments.get(id(block), (block, ()))[1]:
+            if count > interpreter.sp + 1:
+                continue
+
+            key = self.key(block, count, interpreter.symbols.version, interpreter.stack[interpreter.sp + 1 - count:interpreter.sp + 1])
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return count, self.cache[key][1]
+        return None
+
+    def key(self, block, count, version, arguments):
+        return (id(block), count, version, gs_utils.hash_key(arguments))
+
+    def pop_frame(self, interpreter, frame):
+        if not self.calls:
+            return
+
+        call = self.calls[-1]
+        if len(interpreter.call_stack) >= call.depth:
+            self.touch(interpreter, 1)
+            return
+
+        self.calls.pop()
+        if self.calls:
+            parent = self.calls[-1]
+            parent.low = min(parent.low, call.low)
+            parent.tainted = parent.tainted or call.tainted
+
+        if call.tainted:
+            self.pure[id(call.block)] = (call.block, False)
+        else:
+            self.store(interpreter, call)
+
+    def store(self, interpreter, call):
+        count = call.sp - call.low
+        if count > len(call.arguments) or len(interpreter.bracket_stack) != call.brackets:
+            return
+
+        arguments = call.arguments[len(call.arguments) - count:]
+        try:
+            key = self.key(call.block, count, call.version, arguments)
+        except TypeError:
+            return
+
+        outputs = tuple(interpreter.stack[call.low + 1:interpreter.sp + 1])
+        self.cache[key] = (call.block, outputs)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+        counts = self.arguments.setdefault(id(call.block), (call.block, []))[1]
+        if count not in counts:
+            counts.append(count)
@@ -1,8 +1,9 @@
-from gs import *
 from gs_codeblock import *
+from gs_values import *
 import gs_utils
 import operator as op
 import copy
+import functools
 import random
 
 coersion_priority = {
@@ -47,15 +48,41 @@ def coerce(first,second):
     return first,second
 
 def check_type(self,top,second):
-    return isinstance(self.stack[self.sp], top) and isinstance(self.stack[self.sp-1], second)
+    return is_type(self, self.sp, top) and is_type(self, self.sp-1, second)
 
-def sets(self):
-    return set(self.stack[self.sp]), set(self.stack[self.sp-1])
+#Lazy sequences pass as lists as they are, other lazy values are materialised
+def is_type(self,index,t):
+    value = self.stack[index]
+
+    if isinstance(value, t):
+        return True
+
+    if isinstance(value, Lazy) and value.concrete is t:
+        if not value.sequence:
+            self.stack[index] = value.materialise()
+        return True
+
+    return False
+
+#Setwise operators on lists and strings keep the order of first occurrence,
+#an int operand is promoted like any other arithmetic
+def set_op(self, fnc, int_fnc):
+    first, second = coerce(materialise(self.stack[self.sp-1]), materialise(self.stack[self.sp]))
+
+    if isinstance(first, list):
+        result = gs_utils.set_operation(fnc, first, second)
+    elif isinstance(first, str):
+        result = ''.join(gs_utils.set_operation(fnc, first, second))
+    else:
+        result = int_fnc(first, second)
+
+    self.sp -= 1
+    self.stack[self.sp] = result
 
 # Operate on two
 def oper2(self,fnc,should_coerce=True):
-    first = self.stack[self.sp-1]
-    second = self.stack[self.sp]
+    first = materialise(self.stack[self.sp-1])
+    second = materialise(self.stack[self.sp])
 
     if should_coerce:
         first,second = coerce(first,second)
@@ -70,31 +97,30 @@ def cmp(self, fnc):
 
 def op_bit_not(self):
  
-    if isinstance(self.top(), str):
+    if is_type(self, self.sp, str):
         self.call(self.top())
         self.sp -= 1
     elif isinstance(self.top(), CodeBlock):
         self.call(self.top())
         self.sp -= 1
-    elif isinstance(self.top(), list):
+    elif is_type(self, self.sp, list):
         popped_list = self.top()
-        for i,x in enumerate(popped_list):
-            self.stack[self.sp+i] = x
-        self.sp += i
+        self.sp -= 1
+        self.push_many(popped_list)
     else:
         self.stack[self.sp] = ~self.top()
 
 def op_str(self):
 
-    if isinstance(self.top(), list):
+    if is_type(self, self.sp, list):
         s = []
         for i in self.stack[self.sp]:
-            if isinstance(i,str):
+            if isinstance(i,str) or isinstance(i, Lazy) and i.concrete is str:
                 s.append("\'{}\'".format(i))
             else:
                 s.append(str(i))
         self.stack[self.sp] = '[' + ' '.join(s) + ']'
-    elif isinstance(self.top(), str):
+    elif is_type(self, self.sp, str):
         self.stack[self.sp] = '\"' + str(self.stack[self.sp]) + '\"'
     else:
         self.stack[self.sp] = str(self.stack[self.sp])
@@ -102,7 +128,9 @@ def op_str(self):
 
 
 def op_not(self):
-    if self.top() == "" or self.top() == [] or self.top() == 0:
+    if isinstance(self.top(), Lazy):
+        self.stack[self.sp] = int(len(self.top()) == 0)
+    elif self.top() == "" or self.top() == [] or self.top() == 0:
         self.stack[self.sp] = 1
     else:
         self.stack[self.sp] = 0
@@ -124,24 +152,38 @@ def op_cmv(self):
         self.stack[self.sp] = result
     elif isinstance(self.top(), CodeBlock):
         raise NotImplementedError   
-    elif isinstance(self.top(), str):
+    elif is_type(self, self.sp, str):
         result = sorted(self.top())
         self.stack[self.sp] = ''.join(result)
+    elif isinstance(self.top(), IntArray):
+        self.stack[self.sp] = IntArray(numpy.sort(self.top().array))
+    elif isinstance(self.top(), Range):
+        values = self.top().values
+        self.stack[self.sp] = Range(values if values.step > 0 else values[::-1])
     else:
         result = sorted(self.top())
         self.stack[self.sp] = result
 
 def op_add(self):
-    oper2(self,op.__add__)
+    if check_strings(self):
+        first, second = self.stack[self.sp-1], self.stack[self.sp]
+        self.sp -= 1
+        self.stack[self.sp] = concat(first, second)
+    elif check_arrays(self):
+        first, second = arrays(self)
+        self.sp -= 1
+        self.stack[self.sp] = IntArray(numpy.concatenate((first, second)))
+    else:
+        oper2(self,op.__add__)
 
 def op_sub(self):
 
-    if check_type(self,list,list):
-        new_list = list(filter(lambda x: x not in self.top(), self.stack[self.sp-1]))
+    if check_arrays(self):
+        first, second = arrays(self)
         self.sp -= 1
-        self.stack[self.sp] = new_list
+        self.stack[self.sp] = IntArray(first[~numpy.isin(first, second)])
     else:
-        oper2(self,op.__sub__)
+        set_op(self, gs_utils.list_difference, op.__sub__)
 
 def op_mul(self):
     if check_type(self,CodeBlock,int):
@@ -151,13 +193,16 @@ def op_mul(self):
         self.call(loop)
         self.sp -= 2
     elif check_type(self,CodeBlock,list):
-        loop = ForEach(self.top(), self.stack[self.sp-1])
-        self.call(loop)
-        self.sp -= 2
+        if not native_fold(self, self.stack[self.sp-1]):
+            loop = ForEach(self.top(), self.stack[self.sp-1])
+            self.call(loop)
+            self.sp -= 2
     elif check_type(self,CodeBlock,str):
-        loop = ForEach(self.top(), gs_utils.convert_str_list(self.stack[self.sp-1]))
-        self.call(loop)
-        self.sp -= 2
+        items = gs_utils.convert_str_list(self.stack[self.sp-1])
+        if not native_fold(self, items):
+            loop = ForEach(self.top(), items)
+            self.call(loop)
+            self.sp -= 2
     elif check_type(self,list,list):
         result = gs_utils.list_join(self.top(), self.stack[self.sp-1])
         self.sp -= 1
@@ -175,7 +220,9 @@ def op_mul(self):
 
 def op_div(self):
 
-    if isinstance(self.top(), CodeBlock):
+    if check_type(self, CodeBlock, list) and native_map(self, self.stack[self.sp-1]):
+        pass
+    elif isinstance(self.top(), CodeBlock):
         #loop = ForEach(self.frame(), self.stack[self.sp-1], self.top())
         #self.push_loop(loop)
         loop = ForEachFold(self.top(), self.stack[self.sp-1])
@@ -186,6 +233,8 @@ def op_div(self):
         result = gs_utils.list_div(self.stack[self.sp-1],self.top())
         self.sp -= 1
         self.stack[self.sp] = result
+    elif isinstance(self.stack[self.sp-1], Text) and is_type(self, self.sp, str) and self.top():
+        split_text(self, True)
     elif check_type(self, str, str):
         result = self.stack[self.sp-1].split(self.stack[self.sp])
         self.sp -= 1
@@ -193,11 +242,19 @@ def op_div(self):
     else:
         oper2(self,op.__floordiv__,False)
 
+#Split input text without decoding it, the pieces are read as they are used
+def split_text(self, keep_empty):
+    result = self.stack[self.sp-1].split(self.stack[self.sp], keep_empty)
+    self.sp -= 1
+    self.stack[self.sp] = result
+
 def op_mod(self):
     if check_type(self, int, int):
         result = self.stack[self.sp - 1] % self.top()
         self.sp -= 1
         self.stack[self.sp] = result
+    elif isinstance(self.stack[self.sp-1], Text) and is_type(self, self.sp, str) and self.top():
+        split_text(self, False)
     elif check_type(self, str, str):
         result = self.stack[self.sp-1].split(self.stack[self.sp])
         self.sp -= 1
@@ -207,53 +264,49 @@ def op_mod(self):
         self.sp -= 1
         self.stack[self.sp] = result
     elif check_type(self, CodeBlock, list):
-        loop = Map(self.top(), self.stack[self.sp-1])
-        self.call(loop)
-        self.sp -= 2
+        if not native_map(self, self.stack[self.sp-1]):
+            loop = Map(self.top(), self.stack[self.sp-1])
+            self.call(loop)
+            self.sp -= 2
 
 def op_bit_or(self):
-    if check_type(self,list,list):
-        set1,set2 = sets(self)
+    if check_arrays(self):
+        first, second = arrays(self)
         self.sp -= 1
-        self.stack[self.sp] = list(set1 | set2)
+        self.stack[self.sp] = IntArray(unique(numpy.concatenate((first, second))))
     else:
-        result = self.stack[self.sp] | self.stack[self.sp-1]
-        self.sp -= 1
-        self.stack[self.sp] = result
+        set_op(self, gs_utils.list_union, op.__or__)
 
 def op_bit_and(self):
-    if check_type(self,list,list):
-        set1,set2 = sets(self)
+    if check_arrays(self):
+        first, second = arrays(self)
         self.sp -= 1
-        self.stack[self.sp] = list(set1 & set2)
+        self.stack[self.sp] = IntArray(unique(first[numpy.isin(first, second)]))
     else:
-        result = self.stack[self.sp] & self.stack[self.sp-1]
-        self.sp -= 1
-        self.stack[self.sp] = result
+        set_op(self, gs_utils.list_intersection, op.__and__)
 
 def op_bit_xor(self):
-    if check_type(self, list,list):
-        set1,set2 = sets(self)
+    if check_arrays(self):
+        first, second = arrays(self)
         self.sp -= 1
-        self.stack[self.sp] = list(set1 ^ set2)
+        self.stack[self.sp] = IntArray(unique(numpy.concatenate((first[~numpy.isin(first, second)], second[~numpy.isin(second, first)]))))
     else:
-        result = self.stack[self.sp] ^ self.stack[self.sp-1]
-        self.sp -= 1
-        self.stack[self.sp] = result
+        set_op(self, gs_utils.list_symmetric_difference, op.__xor__)
 
 def op_opb(self):
     self.bracket_stack.append(self.sp + 1)
 
 def op_clb(self):
-    start = self.bracket_stack.pop()
-    arr = []
-    for i in range(start,self.sp+1):
-        arr.append(self.stack[i])
+    start = self.bracket_stack.pop() if self.bracket_stack else 0
+    arr = self.stack[start:self.sp+1]
 
     if len(arr) > 0:
         self.sp = start
         self.stack[self.sp] = arr
 
+    if self.sp < self.shrink_at:
+        self.shrink_stack()
+
 def op_swp(self):
     tmp = self.stack[self.sp]
     self.stack[self.sp] = self.stack[self.sp - 1]
@@ -262,13 +315,21 @@ def op_swp(self):
 def op_asn(self):
     keyword = self.stack_frame().get_next_item(self.top())
 
+    if type(keyword) is Literal or type(keyword) is Symbol:
+        keyword = str(keyword)
+
     if keyword not in not_assignable:
         self.symbols[keyword] = self.top()
+        if self.hooks:
+            self.emit("assign", keyword, self.top())
 
 def op_pop(self):
     if self.sp >= 0:
         self.sp -= 1
 
+        if self.sp < self.shrink_at:
+            self.shrink_stack()
+
 def op_lt(self):
 
     if check_type(self, int, list):
@@ -276,7 +337,7 @@ def op_lt(self):
         self.sp -= 1
     elif check_type(self, int, CodeBlock):
         s = ''.join(self.stack[self.sp-1].tokens)[:self.top():]
-        self.stack[self.sp-1].tokens = tokenise(s)[0]
+        self.stack[self.sp-1] = CodeBlock(s)
         self.sp -= 1
     else:
         cmp(self,op.__lt__)
@@ -288,7 +349,7 @@ def op_gt(self):
         self.sp -= 1
     elif check_type(self, int, CodeBlock):
         s = ''.join(self.stack[self.sp-1].tokens)[self.top()::]
-        self.stack[self.sp-1].tokens = tokenise(s)[0]
+        self.stack[self.sp-1] = CodeBlock(s)
         self.sp -= 1
     else:
         cmp(self,op.__gt__)
@@ -321,18 +382,17 @@ def op_eq(self):
 
 def op_arr(self):
     if check_type(self,CodeBlock,list):
-        loop = MapCondition(self.top(), self.stack[self.sp-1])
-        self.call(loop)
-        self.sp -= 2
-    elif isinstance(self.top(), list):
+        if not native_map(self, self.stack[self.sp-1], True):
+            loop = MapCondition(self.top(), self.stack[self.sp-1])
+            self.call(loop)
+            self.sp -= 2
+    elif is_type(self, self.sp, list):
         self.stack[self.sp] = len(self.top())
     else:
-        self.stack[self.sp] = list(range(self.stack[self.sp]))
+        self.stack[self.sp] = int_range(self.stack[self.sp])
 
 def op_dup(self):
-    cpy = copy.deepcopy(self.stack[self.sp])
-    self.sp += 1
-    self.stack[self.sp] = cpy
+    self.push(self.stack[self.sp])
 
 def op_pow(self):
     if check_type(self, int, int):
@@ -346,26 +406,30 @@ def op_pow(self):
 
 def op_dec(self):
     
-    if isinstance(self.top(), list):
+    if is_type(self, self.sp, list):
         x = self.top()[0]
         self.stack[self.sp] = self.top()[1:]
-        self.sp += 1
-        self.stack[self.sp] = x
+        self.push(x)
     else:
         self.stack[self.sp] -= 1
 
 
 def op_inc(self):
-    if isinstance(self.top(), list):
+    if is_type(self, self.sp, list):
         x = self.top()[-1]
         self.stack[self.sp] = self.top()[:-1]
-        self.sp += 1
-        self.stack[self.sp] = x
+        self.push(x)
     else:
         self.stack[self.sp] += 1 
 
 def op_print(self):
-    print(str(self.stack[self.sp]), end='')
+    if self.hooks:
+        self.emit("print", self.stack[self.sp])
+
+    if isinstance(self.stack[self.sp], (Rope, Text)):
+        self.output.write_value(self.stack[self.sp])
+    else:
+        self.output.write(str(self.stack[self.sp]))
     self.sp -= 1   
 
 def op_rand(self):
@@ -408,7 +472,7 @@ def op_abs(self):
 
 def op_zip(self):
 
-    if isinstance(self.top(), list):
+    if is_type(self, self.sp, list):
         arr = list(zip(*self.stack[self.sp]))
 
         for i,v in enumerate(arr):
@@ -420,11 +484,182 @@ def op_zip(self):
 
         self.stack[self.sp] = arr
 
+#n base gives the digits of n, digits base the number they write. Like
+#GolfScript the operands can come in either order, strings are their codes
 def op_base(self):
-    if isinstance(self.stack[self.sp-1], list):
-        s = ''.join(str(e) for e in self.stack[self.sp-1])
-        result = int(s, self.stack[self.sp])
+    if is_type(self, self.sp, int) and is_type(self, self.sp-1, int):
+        result = gs_utils.to_digits(self.stack[self.sp-1], self.stack[self.sp])
+    elif is_type(self, self.sp, int) and is_digits(self, self.sp-1):
+        result = gs_utils.from_digits(digit_list(self.stack[self.sp-1]), self.stack[self.sp])
+    elif is_type(self, self.sp-1, int) and is_digits(self, self.sp):
+        result = gs_utils.from_digits(digit_list(self.stack[self.sp]), self.stack[self.sp-1])
+    else:
+        raise NotImplementedError
+
+    self.sp -= 1
+    self.stack[self.sp] = result
+
+def is_digits(self, index):
+    return is_type(self, index, list) or is_type(self, index, str)
+
+def digit_list(v):
+    if isinstance(v, str):
+        return gs_utils.convert_str_list(v)
+    return list(v)
+
+
+#Python versions of the builtins, only valid when every operand is an int.
+#They also work elementwise on numpy arrays
+native_binary = {
+    op_add : op.__add__,
+    op_sub : op.__sub__,
+    op_mul : op.__mul__,
+    op_div : op.__floordiv__,
+    op_mod : op.__mod__,
+    op_bit_or : op.__or__,
+    op_bit_and : op.__and__,
+    op_bit_xor : op.__xor__,
+    op_lt : lambda a,b: (a < b) * 1,
+    op_gt : lambda a,b: (a > b) * 1,
+    op_eq : lambda a,b: (a == b) * 1,
+}
+
+native_unary = {
+    op_dec : lambda a: a - 1,
+    op_inc : lambda a: a + 1,
+    op_not : lambda a: (a == 0) * 1,
+    op_bit_not : op.__invert__,
+    op_abs : abs,
+}
+
+#Recognise blocks that are a single builtin, or a number and a binary
+#builtin like {-1*}, and return their (binary, unary) Python equivalent.
+#Optimised instructions are looked at as the instructions they replaced
+def native_block(self, block):
+    instructions = []
+    for item in block.instructions:
+        instructions.extend(item.parts if type(item) is Symbol and item.parts is not None else [item])
+
+    items = [item for item in instructions
+                if not (type(item) is Symbol and item.name.isspace() and item.name not in self.symbols)]
+
+    fnc = None
+    if items and type(items[-1]) is Symbol:
+        fnc = self.symbols.get(items[-1].name)
+
+    if not callable(fnc):
+        return None, None
+
+    if len(items) == 1:
+        return native_binary.get(fnc), native_unary.get(fnc)
+
+    if len(items) == 2 and type(items[0]) is Literal and type(items[0].value) is int and items[0].token not in self.symbols and fnc in native_binary:
+        binary = native_binary[fnc]
+        constant = items[0].value
+        return None, lambda a: binary(a, constant)
+
+    return None, None
+
+def all_ints(items):
+    return all(type(x) is int for x in items)
+
+#Both operands are strings or ropes and at least one of them is a rope or long
+def check_strings(self):
+    first, second = self.stack[self.sp-1], self.stack[self.sp]
+
+    if not isinstance(first, (str, Rope)) or not isinstance(second, (str, Rope)):
+        return False
+
+    return len(first) + len(second) >= ROPE_THRESHOLD
+
+#Both operands are int sequences and at least one is already an array or a long range
+def check_arrays(self):
+    first, second = self.stack[self.sp-1], self.stack[self.sp]
+    int_sequences = (IntArray, Range)
+
+    if not isinstance(first, int_sequences) or not isinstance(second, int_sequences):
+        return False
+
+    return int_array(first) is not None and int_array(second, 0) is not None or \
+        int_array(second) is not None and int_array(first, 0) is not None
+
+def arrays(self):
+    return int_array(self.stack[self.sp-1], 0).array, int_array(self.stack[self.sp], 0).array
+
+#Keep the first occurrence of each value in order
+def unique(array):
+    values, index = numpy.unique(array, return_index=True)
+    return array[numpy.sort(index)]
+
+#{+}* and friends over a list of ints
+def native_fold(self, items):
+    binary, unary = native_block(self, self.top())
+
+    if binary is None or not items:
+        return False
+
+    if isinstance(items, Range) and binary is op.__add__:
         self.sp -= 1
-        self.stack[self.sp] = result
+        self.stack[self.sp] = items.sum()
+        return True
+
+    if isinstance(items, IntArray):
+        lo, hi = items.bounds()
+        if binary is op.__add__ and in_int64(len(items) * lo, len(items) * hi):
+            self.sp -= 1
+            self.stack[self.sp] = int(items.array.sum())
+            return True
+        items = items.materialise()
+    elif not all_ints(items):
+        return False
+
+    if binary is op.__add__:
+        result = sum(items)
     else:
-        raise NotImplementedError
\ No newline at end of file
+        result = functools.reduce(binary, items)
+
+    self.sp -= 1
+    self.stack[self.sp] = result
+    return True
+
+#{)}% {)}/ and {3%}, over a list of ints, vectorised for long lists when
+#the result cannot overflow 64 bits
+def native_map(self, items, condition=False):
+    binary, unary = native_block(self, self.top())
+
+    if unary is None or not items:
+        return False
+
+    array = int_array(items)
+    if array is not None:
+        result = array_map(array, unary, condition)
+        if result is not None:
+            self.sp -= 1
+            self.stack[self.sp] = result
+            return True
+        items = array.materialise()
+    elif not all_ints(items):
+        return False
+
+    if condition:
+        result = [x for x in items if unary(x)]
+    else:
+        result = [unary(x) for x in items]
+
+    self.sp -= 1
+    self.stack[self.sp] = result
+    return True
+
+def array_map(array, unary, condition):
+    lo, hi = array.bounds()
+    if not in_int64(unary(lo), unary(hi)):
+        return None
+
+    try:
+        values = unary(array.array)
+    except (OverflowError, TypeError):
+        return None
+
+    if condition:
+        return IntArray(array.array[values != 0])
+    return IntArray(values)
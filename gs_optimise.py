@@ -0,0 +1,148 @@
+import operator as op
+
+import gs_codeblock
+
+#Operators that can be worked out ahead of time on two ints
+FOLD_BINARY = {
+    "+" : op.add,
+    "-" : op.sub,
+    "*" : op.mul,
+    "/" : op.floordiv,
+    "%" : op.mod,
+    "|" : op.or_,
+    "&" : op.and_,
+    "^" : op.xor,
+    "<" : lambda a, b: int(a < b),
+    ">" : lambda a, b: int(a > b),
+    "=" : lambda a, b: int(a == b),
+}
+
+FOLD_UNARY = {
+    "(" : lambda a: a - 1,
+    ")" : lambda a: a + 1,
+    "~" : op.invert,
+    "!" : lambda a: int(a == 0),
+}
+
+#Pairs of operators that undo each other
+CANCEL = {(".", ";"), ("\\", "\\")}
+
+def nothing(interpreter):
+    pass
+
+#Several instructions run as one. fast is what they do when every name in
+#them still means its builtin, otherwise the interpreter runs the parts.
+#value is set when they only push a constant
+def fuse(items, spans, fast, value=None):
+    parts = []
+    for item in items:
+        parts.extend(item.parts if is_fused(item) else [item])
+
+    site = gs_codeblock.Symbol(''.join(str(part) for part in parts), parts)
+    site.fast = fast
+    site.value = value
+
+    spans = [span for span in spans if span is not None]
+    span = (spans[0][0], spans[-1][1]) if spans else None
+    return site, span
+
+def is_fused(item):
+    return type(item) is gs_codeblock.Symbol and item.parts is not None
+
+def is_space(item):
+    return type(item) is gs_codeblock.Symbol and item.parts is None and item.name.isspace()
+
+def is_name(item, names):
+    return type(item) is gs_codeblock.Symbol and item.parts is None and item.name in names
+
+#The value an item pushes if it is a constant, otherwise None
+def constant(item):
+    if type(item) is gs_codeblock.Literal:
+        return item.value
+    if is_fused(item):
+        return item.value
+    return None
+
+def int_constant(item):
+    value = constant(item)
+    return value if type(value) is int else None
+
+def push_constant(value):
+    return lambda interpreter: interpreter.push(value)
+
+#x n op for an int constant n, done in place when x is an int
+def apply_constant(fnc, value, parts):
+    def run(interpreter):
+        sp = interpreter.sp
+        if sp >= 0 and type(interpreter.stack[sp]) is int:
+            interpreter.stack[sp] = fnc(interpreter.stack[sp], value)
+        else:
+            interpreter.execute_parts(parts)
+    return run
+
+#Try to replace the last few instructions with one, returns whether it did
+def reduce_tail(items, spans):
+    if len(items) < 2:
+        return False
+
+    #A name after : is what gets assigned, so it is never combined
+    first = len(items) - 2
+    protected = lambda i: i > 0 and is_name(items[i-1], (":",))
+
+    a, b = items[-2], items[-1]
+    if protected(first) or is_name(a, (":",)) or is_name(b, (":",)):
+        return False
+
+    if is_space(b) and (type(a) is gs_codeblock.Literal or is_fused(a)):
+        fast = push_constant(a.value) if type(a) is gs_codeblock.Literal else a.fast
+        replace(items, spans, 2, *fuse([a, b], spans[-2:], fast, constant(a)))
+        return True
+
+    if len(items) >= 3 and not protected(len(items) - 3) and not is_name(items[-3], (":",)):
+        x = int_constant(items[-3])
+        y = int_constant(a)
+        if x is not None and y is not None and is_name(b, FOLD_BINARY) and not (b.name in "/%" and y == 0):
+            value = FOLD_BINARY[b.name](x, y)
+            replace(items, spans, 3, *fuse(items[-3:], spans[-3:], push_constant(value), value))
+            return True
+
+    x = int_constant(a)
+    if x is not None and is_name(b, FOLD_UNARY):
+        value = FOLD_UNARY[b.name](x)
+        replace(items, spans, 2, *fuse([a, b], spans[-2:], push_constant(value), value))
+        return True
+
+    if constant(a) is not None and is_name(b, (";",)):
+        replace(items, spans, 2, *fuse([a, b], spans[-2:], nothing))
+        return True
+
+    if type(a) is gs_codeblock.Symbol and a.parts is None and type(b) is gs_codeblock.Symbol and (a.name, b.name) in CANCEL:
+        replace(items, spans, 2, *fuse([a, b], spans[-2:], nothing))
+        return True
+
+    if x is not None and is_name(b, FOLD_BINARY) and not (b.name in "/%" and x == 0):
+        parts = (a.parts if is_fused(a) else [a]) + [b]
+        replace(items, spans, 2, *fuse([a, b], spans[-2:], apply_constant(FOLD_BINARY[b.name], x, parts)))
+        return True
+
+    return False
+
+def replace(items, spans, count, item, span):
+    del items[-count:]
+    del spans[-count:]
+    items.append(item)
+    spans.append(span)
+
+#Fold constant arithmetic, drop instructions that cancel out and fuse a
+#constant with the operator after it. The tokens are left alone, each new
+#instruction covers the source of the ones it replaces
+def optimise(instructions):
+    items, spans = [], []
+
+    for item, span in zip(*instructions):
+        items.append(item)
+        spans.append(span)
+        while reduce_tail(items, spans):
+            pass
+
+    return items, spans
@@ -0,0 +1,70 @@
+import io
+import sys
+
+import gs_utils
+import gs_values
+
+BUFFER_SIZE = 1 << 16
+
+#Where print and the output at the end of a program go. Writes are kept
+#until buffer_size characters are waiting and then handed over in one
+#piece. Without a stream it writes to whatever sys.stdout is at the time.
+#In binary mode strings are encoded as utf8 and bytes are written
+class Output:
+    def __init__(self, stream=None, buffer_size=BUFFER_SIZE, binary=False):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.binary = binary
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        if self.binary and isinstance(text, str):
+            text = text.encode("utf8")
+
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    #Write a value the way GolfScript shows it, lists flattened
+    def write_value(self, v):
+        if self.binary and isinstance(v, gs_values.Text):
+            self.write(bytes(v.data[v.start:v.stop]))
+            return
+
+        parts = []
+        gs_utils.append_string(parts, v)
+        for part in parts:
+            self.write(part)
+
+    #What is left on the stack when a program ends, with a newline after it
+    def write_result(self, stack):
+        self.write_value(stack)
+        self.write("\n")
+
+    def flush(self):
+        if not self.parts:
+            return
+
+        data = (b'' if self.binary else '').join(self.parts)
+        self.parts = []
+        self.size = 0
+
+        stream = self.target()
+        stream.write(data)
+        stream.flush()
+
+    def target(self):
+        if self.stream is not None:
+            return self.stream
+        return sys.stdout.buffer if self.binary else sys.stdout
+
+    #Everything written so far, for outputs made by capture()
+    def getvalue(self):
+        self.flush()
+        return self.stream.getvalue()
+
+#Keep the output in memory instead of writing it anywhere
+def capture(binary=False, buffer_size=BUFFER_SIZE):
+    return Output(io.BytesIO() if binary else io.StringIO(), buffer_size, binary)
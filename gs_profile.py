@@ -0,0 +1,129 @@
+import json
+import time
+
+from gs_codeblock import CodeBlock, Literal, Symbol
+
+class Stats:
+    def __init__(self):
+        self.count = 0
+        self.self_time = 0
+        self.inclusive_time = 0
+
+    def add(self, self_time, inclusive_time):
+        self.count += 1
+        self.self_time += self_time
+        self.inclusive_time += inclusive_time
+
+    def to_json(self):
+        return {
+            "count" : self.count,
+            "self" : self.self_time / 1e9,
+            "inclusive" : self.inclusive_time / 1e9,
+        }
+
+#An item that pushed frames, it is finished when they have all been popped
+class Entry:
+    def __init__(self, name, function, span, start, depth):
+        self.name = name
+        self.function = function
+        self.span = span
+        self.start = start
+        self.depth = depth
+        self.child_time = 0
+
+#Set Interpreter.profile to one of these to record where time goes. Times
+#are kept per symbol, per operator function and per source span. Running
+#an item that calls a block counts until the frames it pushed are gone
+class Profile:
+    def __init__(self):
+        self.symbols = {}
+        self.functions = {}
+        self.spans = {}
+        self.stacks = {}
+        self.open = []
+
+    def execute(self, interpreter, item):
+        if type(item) is Symbol and item.name.isspace():
+            interpreter.execute_hooked(item)
+            return
+
+        frame = interpreter.call_stack[-1]
+        depth = len(interpreter.call_stack)
+
+        start = time.perf_counter_ns()
+        interpreter.execute_hooked(item)
+        end = time.perf_counter_ns()
+
+        entry = Entry(self.name(item), self.function(interpreter, item), self.span(frame, item), start, depth)
+        if len(interpreter.call_stack) > depth:
+            self.open.append(entry)
+        else:
+            self.finish(entry, end)
+
+    def frame_popped(self, interpreter):
+        if self.open and len(interpreter.call_stack) <= self.open[-1].depth:
+            end = time.perf_counter_ns()
+            while self.open and len(interpreter.call_stack) <= self.open[-1].depth:
+                self.finish(self.open.pop(), end)
+
+    def finish(self, entry, end):
+        inclusive_time = end - entry.start
+        self_time = inclusive_time - entry.child_time
+
+        if self.open:
+            self.open[-1].child_time += inclusive_time
+
+        if entry.name is not None:
+            self.symbols.setdefault(entry.name, Stats()).add(self_time, inclusive_time)
+            path = ";".join(["main"] + [e.name for e in self.open if e.name is not None] + [entry.name])
+            self.stacks[path] = self.stacks.get(path, 0) + self_time
+        if entry.function is not None:
+            self.functions.setdefault(entry.function, Stats()).add(self_time, inclusive_time)
+        if entry.span is not None:
+            self.spans.setdefault(entry.span, Stats()).add(self_time, inclusive_time)
+
+    def name(self, item):
+        if type(item) is Symbol:
+            return item.name
+        if isinstance(item, CodeBlock) and item.immediate:
+            return "{block}"
+        return None
+
+    def function(self, interpreter, item):
+        if type(item) is Symbol:
+            translation = interpreter.symbols.get(item.name)
+            if callable(translation):
+                return translation.__name__
+        return None
+
+    #Where a program item came from, as (start, end, token)
+    def span(self, frame, item):
+        if type(frame) is not CodeBlock or frame.ip == 0:
+            return None
+
+        index = frame.instructions_index[frame.ip-1]
+        if index is None:
+            return None
+
+        if type(item) is Symbol:
+            token = item.name
+        elif type(item) is Literal:
+            token = item.token
+        else:
+            token = str(item)
+        return (index[0], index[1], token)
+
+    def to_json(self):
+        return {
+            "symbols" : {name: stats.to_json() for name, stats in self.symbols.items()},
+            "functions" : {name: stats.to_json() for name, stats in self.functions.items()},
+            "spans" : [dict(start=start, end=end, token=token, **stats.to_json())
+                       for (start, end, token), stats in sorted(self.spans.items())],
+        }
+
+    def dump_json(self, f):
+        json.dump(self.to_json(), f, indent=2)
+
+    #One "main;caller;name microseconds" line per call path, for flamegraph tools
+    def collapsed(self):
+        return "".join("{} {}\n".format(path, ns // 1000) for path, ns in sorted(self.stacks.items()))
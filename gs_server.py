@@ -6,13 +6,14 @@ import re
 import threading
 import os
 import copy
-from gs_codeblock import CodeBlock
+from gs_codeblock import CodeBlock, tokenise
 
 import gs_interpreter
 import dap_events
 
 HOST = "127.0.0.1"
 PORT = 65432
+STEPS_PER_POLL = 10000
 pattern = re.compile(r"Content-Length: (\d*)\s+({.+})")
 
 
@@ -118,6 +119,7 @@ class Debugger:
         self.running = False
         self.source = None
         self.run_to_frame = None
+        self.breakpoint_lines = set()
 
         self.command_map = {
             "initialize" : self.initialize,
@@ -171,7 +173,10 @@ class Debugger:
 
             if self.interpreter:
                 if self.running:
-                    self.interpreter.execute_instruction()
+                    reason = self.interpreter.run(max_steps=STEPS_PER_POLL)
+                    if reason == "breakpoint":
+                        self.running = False
+                        self.server.send_msg(dap_events.stop_event("breakpoint").event())
                 else:
                     self.wait()
 
@@ -343,8 +348,7 @@ class Debugger:
     def step_out(self,command):
         self.server.send_msg(command.response())
         frame = len(self.interpreter.call_stack) - 1
-        while len(self.interpreter.call_stack) > frame:
-            self.interpreter.execute_instruction()
+        self.interpreter.run(until=lambda interpreter: len(interpreter.call_stack) <= frame)
 
         event = dap_events.stop_event("step")
         self.server.send_msg(event.event())
@@ -353,9 +357,7 @@ class Debugger:
         self.server.send_msg(command.response())
         frame = len(self.interpreter.call_stack)
         self.interpreter.execute_instruction()
-
-        while len(self.interpreter.call_stack) > frame:
-            self.interpreter.execute_instruction()
+        self.interpreter.run(until=lambda interpreter: len(interpreter.call_stack) <= frame)
 
         event = dap_events.stop_event("step")
         self.server.send_msg(event.event())
@@ -459,15 +461,35 @@ class Debugger:
     def set_breakpoints(self,command):
         breakpoints = command["arguments"]["breakpoints"]
 
+        self.breakpoint_lines = set(breakpoint["line"] for breakpoint in breakpoints)
+        offsets = self.apply_breakpoints()
+
         response_breakpoints = []
         for breakpoint in breakpoints:
-            breakpoint["verified"] = True
+            breakpoint["verified"] = self.interpreter is None or breakpoint["line"] in offsets
             response_breakpoints.append(breakpoint)
 
         self.server.send_msg(command.response({
             "breakpoints" : breakpoints
         }))
 
+    #Breakpoints are on lines, the interpreter stops on the start of any token on them
+    def apply_breakpoints(self):
+        if not self.interpreter:
+            return {}
+
+        offsets = {}
+        line = 1
+        last = 0
+        for start,end in tokenise(self.text)[1]:
+            line += self.text.count('\n', last, start)
+            last = start
+            if line in self.breakpoint_lines:
+                offsets.setdefault(line, set()).add(start)
+
+        self.interpreter.breakpoints = set().union(*offsets.values())
+        return offsets
+
     def finish(self):
         event = dap_events.Event("terminated")
         self.server.send_msg(event.event())
@@ -489,8 +511,10 @@ class Debugger:
             f.close()
             txt = txt.replace('\r','')
             self.interpreter = gs_interpreter.Interpreter(txt)
+            self.interpreter.tail_calls = False
             self.text = txt
             self.lines = txt.split('\n')
+            self.apply_breakpoints()
             self.server.send_msg(command.response()) 
 
             event = dap_events.Event('initialized')
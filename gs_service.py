@@ -0,0 +1,197 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import socket
+import struct
+import threading
+
+from gs_codeblock import CodeBlock
+import gs_batch
+import gs_interpreter
+
+HOST = "127.0.0.1"
+PORT = 65433
+MAX_MESSAGE_SIZE = 1 << 26
+
+#Every message is a 4 byte big endian length followed by that much JSON
+header = struct.Struct(">I")
+
+def send_message(conn, obj):
+    data = json.dumps(obj).encode("utf8")
+    conn.sendall(header.pack(len(data)) + data)
+
+def receive_exactly(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def receive_message(conn):
+    data = receive_exactly(conn, header.size)
+    if data is None:
+        return None
+
+    (size,) = header.unpack(data)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError("Message of {} bytes is too large".format(size))
+
+    data = receive_exactly(conn, size)
+    if data is None:
+        return None
+    return json.loads(data.decode("utf8"))
+
+#Workers keep the programs they have parsed, so a program that is sent
+#again starts running straight away
+@functools.lru_cache(maxsize=256)
+def parse(text):
+    return CodeBlock(text, optimise=True)
+
+def warm_worker():
+    gs_interpreter.Interpreter("1 1+").execute()
+
+#The limits a request runs under. A request can only tighten the service's
+#limits, a limit it leaves out or sets to None stays as the service has it
+def clamp_limits(default_limits, requested):
+    options = {"check_interval": gs_interpreter.CHECK_INTERVAL}
+    options.update((name, value) for name, value in (default_limits or {}).items() if value is not None)
+
+    for name, value in (requested or {}).items():
+        if value is None:
+            continue
+        options[name] = value if options.get(name) is None else min(options[name], value)
+
+    options["check_interval"] = max(1, options["check_interval"])
+    return options
+
+#Run a request in a worker. A request is {"id", "program", "stdin", "limits"},
+#only program is needed, limits holds keyword arguments for Limits
+def evaluate(request, default_limits=None):
+    try:
+        code = parse(request["program"])
+        limits = gs_interpreter.Limits(**clamp_limits(default_limits, request.get("limits")))
+    except Exception as e:
+        result = {"status": "error", "error": "{}: {}".format(type(e).__name__, e), "output": "", "steps": 0, "time": 0.0}
+    else:
+        result = gs_batch.run_program(code, request.get("stdin"), limits)
+
+    result["id"] = request.get("id")
+    return result
+
+#Accepts any number of connections. Requests on a connection can be sent
+#without waiting, each is answered as soon as a worker finishes it, so
+#replies may come back in a different order and are matched up by id
+class Service:
+    def __init__(self, host=HOST, port=PORT, processes=None, limits=None):
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.limits = limits
+        self.pool = None
+        self.socket = None
+        self.quit = False
+
+    def start(self):
+        self.pool = multiprocessing.Pool(self.processes, initializer=warm_worker)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.port = self.socket.getsockname()[1]
+        self.socket.listen()
+        self.accept_thread = threading.Thread(target=self.accept, daemon=True)
+        self.accept_thread.start()
+
+    def accept(self):
+        while not self.quit:
+            try:
+                conn, client_addr = self.socket.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        lock = threading.Lock()
+
+        def reply(result):
+            with lock:
+                try:
+                    send_message(conn, result)
+                except OSError:
+                    pass
+
+        def reply_error(request):
+            return lambda e: reply({"id": request.get("id"), "status": "error", "error": "{}: {}".format(type(e).__name__, e)})
+
+        try:
+            while not self.quit:
+                request = receive_message(conn)
+                if request is None:
+                    break
+                self.pool.apply_async(evaluate, (request, self.limits), callback=reply, error_callback=reply_error(request))
+        except (OSError, ValueError) as e:
+            reply({"id": None, "status": "error", "error": "{}: {}".format(type(e).__name__, e)})
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.quit = True
+        self.socket.close()
+        self.pool.terminate()
+        self.pool.join()
+
+class Client:
+    def __init__(self, host=HOST, port=PORT):
+        self.conn = socket.create_connection((host, port))
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.next_id = 0
+
+    #Send a program without waiting for its result, returns its id
+    def submit(self, program, stdin=None, limits=None):
+        self.next_id += 1
+        send_message(self.conn, {"id": self.next_id, "program": program, "stdin": stdin, "limits": limits})
+        return self.next_id
+
+    def receive(self):
+        return receive_message(self.conn)
+
+    def evaluate(self, program, stdin=None, limits=None):
+        request_id = self.submit(program, stdin, limits)
+        while True:
+            result = self.receive()
+            if result is None or result["id"] == request_id:
+                return result
+
+    def close(self):
+        self.conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve GolfScript evaluation requests from a pool of warm workers")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument("--max-steps", type=int)
+    parser.add_argument("--timeout", type=float)
+    parser.add_argument("--max-stack", type=int)
+    parser.add_argument("--max-call-depth", type=int)
+    parser.add_argument("--max-memory", type=int)
+    args = parser.parse_args(argv)
+
+    limits = {"max_steps": args.max_steps, "timeout": args.timeout, "max_stack": args.max_stack,
+              "max_call_depth": args.max_call_depth, "max_memory": args.max_memory}
+    service = Service(args.host, args.port, args.jobs, limits)
+    service.start()
+    print("Serving on {}:{}".format(service.host, service.port))
+
+    try:
+        service.accept_thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+if __name__ == "__main__":
+    main()
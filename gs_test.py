@@ -1,6 +1,18 @@
 import unittest
+import tempfile
+import time
 import gs_interpreter
+import gs_batch
+import gs_service
+import gs_output
+import gs_profile
+import gs_bench
+import gs_memo
+import gs_utils
+import gs_server
+import dap_events
 from gs_codeblock import CodeBlock
+from gs_values import Text, Lines, read_text
 
 
 
@@ -17,6 +29,17 @@ class TestInterpreter(unittest.TestCase):
         else:
             self.assertEqual(test_result, result)
 
+    def test_literals(self):
+        self.check("-12 3", [-12, 3])
+        self.check("\"a\\nb\"", "a\nb")
+        self.check("'it\\'s'", "it's")
+        self.check("\"'q'\"", "'q'")
+
+    def test_block_literal(self):
+        self.check("{1{2}}~", [1, CodeBlock("2")])
+        self.check("{{1}~}3*", [1,1,1])
+        self.assertRaises(Exception, self.check, "{1", None)
+
     def test_op_bit_not(self):
         self.check("5~", -6)
         self.check("\"1 2+\"~", 3)
@@ -56,6 +79,9 @@ class TestInterpreter(unittest.TestCase):
         self.check("1 2- 3+", 2)
 
         self.check("[5 2 5 4 1 1][1 2]-", [5, 5, 4])
+        self.check("[[1] [2] [1]][[2]]-", [[1],[1]])
+        self.check("[1 2 3]2-", [1,3])
+        self.check("\"hello\" \"l\"-", "heo")
 
     def test_op_mul(self):
         self.check("5 7*", 35)
@@ -86,16 +112,70 @@ class TestInterpreter(unittest.TestCase):
         self.check("[1 2 3 4 5] -1%", [5,4,3,2,1])
         self.check("[1 2 3]{.}%", [1,1,2,2,3,3])
 
+    def test_loops_keep_input(self):
+        self.check("[1 2 3]:a{1+}%a", [[2,3,4],[1,2,3]])
+        self.check("[1 2 3]:a{2<},a", [[1],[1,2,3]])
+        self.check("[1 2 3]:a{1+}/a", [[2,3,4],[1,2,3]])
+        self.check("2000,{+}*", 1999000)
+
+    def test_native_blocks(self):
+        self.check("[1 2 3]{-1*}%", [-1,-2,-3])
+        self.check("[1 2 3]{)}/", [2,3,4])
+        self.check("[5 3 2]{-}*", 0)
+        self.check("5,{(},", [0,2,3,4])
+        self.check("[1 [2]]{)}%", [2,[],2])
+        self.check("{-}:+;[1 2 3]{+}*", -4)
+
+    def test_rope(self):
+        self.check("\"\"{\"ab\"+}1000*", "ab"*1000)
+        self.check("\"\"{\"ab\"+}300*.+'c'+", "ab"*600+"c")
+        self.check("\"\"{\"ab\"+}300*`", '"' + "ab"*300 + '"')
+        self.check("\"\"{\"ab\"+}300*\"ab\"/,", 301)
+        self.check("[\"\"{\"ab\"+}300* 'c']''*", "ab"*300+"c")
+        self.check("['x'300* 'y'300* + 'a']$", ["a", "x"*300+"y"*300])
+        self.check("['y' 'x'300* 'y'300* +]$", ["x"*300+"y"*300, "y"])
+        self.check("['x'300* 'y'300* +]['x'300*]>", 1)
+        self.check("['x'300* 'y'300* +]`", "['" + "x"*300 + "y"*300 + "']")
+
+    def test_lazy_range(self):
+        self.check("10000000,5<", [0,1,2,3,4])
+        self.check("10000000,{+}*", 49999995000000)
+        self.check("10000000,-1%$2=", 2)
+        self.check("10000000,3%)\\;", 9999999)
+        self.check("10,3>2%7,-", [7,9])
+        self.check("5,~", [0,1,2,3,4])
+        self.check("3,{,}%-1%$", [[],[0],[0,1]])
+        self.check("[3, 2,]$", [[0,1],[0,1,2]])
+        self.check("[2,][3,]<", 1)
+        self.check("[3,][2,]>", 1)
+        self.check("[[0 1]2,]$", [[0,1],[0,1]])
+
+    def test_int_arrays(self):
+        self.check("3000,{)}%2000=", 2001)
+        self.check("3000,{3%},,", 2000)
+        self.check("3000,{+}*", 4498500)
+        self.check("3000,-1%$2%,", 1500)
+        self.check("3000,.+{2<},", [0,1,0,1])
+        self.check("3000,5>5<", [5,6,7,8,9])
+        self.check("3000,2000,-,", 1000)
+        self.check("3000,{9223372036854775807+}%)", [[9223372036854775807+x for x in range(2999)], 9223372036854775807+2999])
+        self.check("[1]3000,+'-'*", "-".join(str(x) for x in [1]+list(range(3000))))
+
     def test_op_bit_or(self):
         self.check("5 3|", 7)
+        self.check("[3 1 3][2 1 4]|", [3,1,2,4])
+        self.check("[[1] {a}][{a} [2]]|", [[1],CodeBlock("a"),[2]])
 
     def test_op_bit_and(self):
         self.check("2 1&", 0)
         self.check("[1 1 2 2][1 3]&", [1])
+        self.check("[3 2 1 3][1 3]&", [3,1])
+        self.check("\"hello\" \"lo\"&", "lo")
 
     def test_op_bit_xor(self):
         self.check("2 1^", 3)
         self.check("[1 1 2 2][1 3]^", [2,3])
+        self.check("[[1] [2]][[2] [3]]^", [[1],[3]])
 
     def test_op_bracket(self):
         self.check("[ 1 2 3 4 ] [ 1 2 ]", [[1,2,3,4],[1,2]])
@@ -107,6 +187,14 @@ class TestInterpreter(unittest.TestCase):
     def test_op_asn(self):
         self.check("1:a a", [1,1])
         self.check("{1 1+}:x; x", 2)
+        self.check("[1 2 3]:a{+}*a", [6,[1,2,3]])
+        self.check("[3 1 2]:a{.}%;a", [3,1,2])
+        self.check("{1}:a;a {2}:a; a", [1,2])
+        self.check("1:x;{x}:f; f 5:x; f", [1,5])
+        self.check("2:1;1", 2)
+        self.check("{1 1+}:f; f 3:1; f", [2,6])
+        self.check("'b':'a';'a' 'c'", ["b","c"])
+        self.check("5:2;[1 2 3]{2*}%", [5,25,15])
 
     def test_op_pop(self):
         self.check("1 2 3;", [1, 2])
@@ -134,6 +222,340 @@ class TestInterpreter(unittest.TestCase):
         self.check("10,,", 10)
         self.check("10,{3%},", [1,2,4,5,7,8])
 
+    def test_stack_growth(self):
+        self.check("[1000,~]$,", 1000)
+
+        interpreter = gs_interpreter.Interpreter("100,~")
+        interpreter.execute()
+        self.assertEqual(interpreter.high_water, 100)
+
+        interpreter = gs_interpreter.Interpreter("1000,~", max_stack=600)
+        self.assertRaises(gs_interpreter.StackOverflowError, interpreter.execute)
+
+    def test_limits(self):
+        limits = gs_interpreter.Limits(max_steps=5000, check_interval=64)
+        interpreter = gs_interpreter.Interpreter("1{)1}do", limits=limits)
+        with self.assertRaises(gs_interpreter.LimitExceeded) as error:
+            interpreter.execute()
+        self.assertEqual(error.exception.kind, "steps")
+        self.assertEqual(error.exception.steps, 5001)
+        self.assertTrue(error.exception.stack)
+
+        interpreter = gs_interpreter.Interpreter("1 2+", limits=limits)
+        self.assertEqual(interpreter.execute(), [3])
+
+        interpreter = gs_interpreter.Interpreter("1{1}do", limits=gs_interpreter.Limits(timeout=0.05))
+        with self.assertRaises(gs_interpreter.LimitExceeded) as error:
+            interpreter.execute()
+        self.assertEqual(error.exception.kind, "time")
+
+        interpreter = gs_interpreter.Interpreter("[0]{100,+.}do", limits=gs_interpreter.Limits(max_memory=100000))
+        with self.assertRaises(gs_interpreter.LimitExceeded) as error:
+            interpreter.execute()
+        self.assertEqual(error.exception.kind, "memory")
+
+        interpreter = gs_interpreter.Interpreter("{f 1}:f;f", limits=gs_interpreter.Limits(max_call_depth=100))
+        with self.assertRaises(gs_interpreter.LimitExceeded) as error:
+            interpreter.execute()
+        self.assertEqual(error.exception.kind, "call depth")
+
+        interpreter = gs_interpreter.Interpreter("1000,~", limits=gs_interpreter.Limits(max_stack=600))
+        self.assertRaises(gs_interpreter.StackOverflowError, interpreter.execute)
+
+    def test_stdin(self):
+        program = CodeBlock("~+")
+        self.assertEqual(gs_interpreter.Interpreter(program, stdin="1 2").execute(), [3])
+        self.assertEqual(gs_interpreter.Interpreter(program, stdin="3 4").execute(), [7])
+
+    def test_batch(self):
+        gs_batch.init_worker("~.*", gs_interpreter.Limits(max_steps=100))
+        self.assertEqual(gs_batch.run_job((0, "a", None, "7"))["output"], "49\n")
+        self.assertEqual(gs_batch.run_job((1, "b", "1 2 print", None))["output"], "21\n")
+        self.assertEqual(gs_batch.run_job((2, "c", "1{1}do", None))["status"], "limit")
+
+        jobs = [(i, str(i), None, str(i)) for i in range(8)]
+        results = list(gs_batch.run_batch(jobs, "~.*", processes=2))
+        self.assertEqual(sorted(r["output"] for r in results), sorted(str(i*i) + "\n" for i in range(8)))
+
+    def test_service(self):
+        self.assertEqual(gs_service.evaluate({"id": 1, "program": "~.*", "stdin": "6"})["output"], "36\n")
+        self.assertEqual(gs_service.evaluate({"id": 2, "program": "1{1}do", "limits": {"max_steps": 100}})["status"], "limit")
+        self.assertEqual(gs_service.evaluate({"id": 3, "program": "1", "limits": {"bad": 1}})["status"], "error")
+
+        server = {"max_steps": 100, "timeout": 5.0, "max_memory": None}
+        self.assertEqual(gs_service.clamp_limits(server, {"max_steps": None, "timeout": None, "max_memory": 1000}),
+                         {"check_interval": gs_interpreter.CHECK_INTERVAL, "max_steps": 100, "timeout": 5.0, "max_memory": 1000})
+        self.assertEqual(gs_service.clamp_limits(server, {"max_steps": 10**9, "timeout": 1.0, "check_interval": -1}),
+                         {"check_interval": 1, "max_steps": 100, "timeout": 1.0})
+        self.assertEqual(gs_service.evaluate({"id": 4, "program": "1{1}do", "limits": {"max_steps": None}}, server)["status"], "limit")
+
+        service = gs_service.Service(port=0, processes=2)
+        service.start()
+        try:
+            client = gs_service.Client(port=service.port)
+            ids = [client.submit("~)", str(i)) for i in range(5)]
+            results = {}
+            for _ in ids:
+                result = client.receive()
+                results[result["id"]] = result["output"]
+            self.assertEqual(results, {id: str(i+1) + "\n" for i, id in enumerate(ids)})
+            self.assertEqual(client.evaluate("1 2+")["output"], "3\n")
+            client.close()
+
+            client = gs_service.Client(port=service.port)
+            client.conn.sendall(gs_service.header.pack(5) + b"{bad}")
+            result = client.receive()
+            self.assertEqual((result["id"], result["status"]), (None, "error"))
+            client.close()
+        finally:
+            service.stop()
+
+    def test_snapshot(self):
+        interpreter = gs_interpreter.Interpreter("{.*}:sq;10,")
+        interpreter.execute()
+        self.assertEqual(interpreter.fork("{sq}%{+}*").execute(), [285])
+        self.assertEqual(interpreter.fork("~sq", stdin="3").execute(), [[0,1,2,3,4,5,6,7,8,9], 9])
+        self.assertEqual(interpreter.execute(), [[0,1,2,3,4,5,6,7,8,9]])
+
+        interpreter = gs_interpreter.Interpreter("[1 2 3]{1+2*}% 5{1+}5*")
+        interpreter.run(max_steps=17)
+        snapshot = interpreter.snapshot()
+        first = interpreter.execute()
+        interpreter.restore(snapshot)
+        self.assertEqual(interpreter.execute(), first)
+        self.assertEqual(first, [[4,6,8], 10])
+
+        interpreter = gs_interpreter.Interpreter("[1 2 3 4]{2%1=}, 1 2:x;")
+        interpreter.run(max_steps=13)
+        other = interpreter.fork()
+        self.assertEqual(other.execute(), interpreter.execute())
+        self.assertEqual(other.symbols["x"], 2)
+
+        interpreter = gs_interpreter.Interpreter("{.*}:sq; 1 print", limits=gs_interpreter.Limits(timeout=0.2, max_steps=12, check_interval=1),
+                                                 output=gs_output.capture(), optimise=True)
+        interpreter.execute()
+        time.sleep(0.3)
+        other = interpreter.fork("3 sq 2 print", output=gs_output.capture())
+        self.assertEqual(other.execute(), [9])
+        self.assertEqual((interpreter.output.getvalue(), other.output.getvalue()), ("1", "2"))
+        self.assertTrue(other.optimise)
+        self.assertEqual(interpreter.fork("1 2+").call_stack[-1].instructions[0].name, "1 2+")
+
+        interpreter.profile = gs_profile.Profile()
+        other = interpreter.fork("2 sq")
+        self.assertIsNot(other.profile, interpreter.profile)
+        self.assertIsNot(interpreter.fork().output, interpreter.output)
+
+    def check_input(self, text, stdin, result):
+        interpreter = gs_interpreter.Interpreter(text, stdin=stdin)
+        self.assertEqual(interpreter.execute(), result)
+
+    def test_text_input(self):
+        stdin = Text(b"3\n1\n\n2\n")
+        self.check_input("n/", stdin, [["3","1","","2",""]])
+        self.check_input("n%", stdin, [["3","1","2"]])
+        self.check_input("n%{~}%{+}*", stdin, [6])
+        self.check_input("n%,", stdin, [3])
+        self.check_input("~+", Text(b"1 2"), [3])
+        self.assertIsInstance(stdin.split("\n"), Lines)
+        self.assertEqual(stdin.split("\n")[1:3], ["1",""])
+
+        with tempfile.TemporaryFile() as f:
+            f.write(b"a,b,,c")
+            f.seek(0)
+            self.assertEqual(read_text(f), "a,b,,c")
+            f.seek(0)
+            text = read_text(f, threshold=1)
+        self.assertIsInstance(text, Text)
+        self.check_input("\",\"%", text, [["a","b","c"]])
+
+    def test_output(self):
+        output = gs_output.capture()
+        interpreter = gs_interpreter.Interpreter("1 print [1 2]print 'a'p 3 puts", output=output)
+        interpreter.execute()
+        self.assertEqual(output.getvalue(), "1[1, 2]\"a\"\n3\n")
+
+        output = gs_output.capture(binary=True)
+        gs_interpreter.Interpreter("'h\u00e9'print", output=output).execute()
+        self.assertEqual(output.getvalue(), "hé".encode("utf8"))
+
+        stream = gs_output.io.StringIO()
+        output = gs_output.Output(stream, buffer_size=4)
+        output.write("ab")
+        self.assertEqual(stream.getvalue(), "")
+        output.write_value([1, ["c"]])
+        self.assertEqual(stream.getvalue(), "ab1c")
+        output.write("d")
+        output.flush()
+        self.assertEqual(stream.getvalue(), "ab1cd")
+
+        interpreter = gs_interpreter.Interpreter("1 print 2 print", output=gs_output.Output(stream, buffer_size=100))
+        interpreter.run(max_steps=4)
+        self.assertEqual(stream.getvalue(), "ab1cd1")
+
+    def test_profile(self):
+        interpreter = gs_interpreter.Interpreter("{.*}:sq; 3 sq 4 sq+ {)}5*")
+        interpreter.profile = gs_profile.Profile()
+        self.assertEqual(interpreter.execute(), [30])
+
+        profile = interpreter.profile
+        self.assertEqual(profile.symbols["sq"].count, 2)
+        self.assertEqual(profile.symbols["*"].count, 3)
+        self.assertEqual(profile.functions["op_mul"].count, 3)
+        self.assertEqual(profile.functions["op_inc"].count, 5)
+        self.assertGreaterEqual(profile.symbols["sq"].inclusive_time, profile.symbols["sq"].self_time)
+        self.assertEqual(profile.spans[(11, 13, "sq")].count, 1)
+        self.assertNotIn(" ", profile.symbols)
+        self.assertFalse(profile.open)
+
+        data = profile.to_json()
+        self.assertEqual(data["symbols"]["sq"]["count"], 2)
+        self.assertIn({"start": 1, "end": 2, "token": "."}, [{k: s[k] for k in ("start", "end", "token")} for s in data["spans"]])
+        self.assertIn("main;sq;*", [line.split()[0] for line in profile.collapsed().splitlines()])
+
+    def test_bench(self):
+        result = gs_bench.measure("100,{.*}%{+}*", repeat=1)
+        interpreter = gs_interpreter.Interpreter("100,{.*}%{+}*")
+        interpreter.execute()
+        self.assertEqual(result["steps"], interpreter.steps)
+        self.assertGreater(result["peak_memory"], 0)
+
+        baseline = {"a": {"wall_time": 1.0, "peak_memory": 100}, "b": {"wall_time": 1.0, "peak_memory": 100}}
+        results = {"a": {"wall_time": 1.2, "peak_memory": 100}, "b": {"wall_time": 1.0, "peak_memory": 200}, "c": {"wall_time": 9.0, "peak_memory": 1}}
+        self.assertEqual(gs_bench.compare(results, baseline, 0.25), [("b", "peak_memory", 100, 200)])
+        self.assertEqual(len(gs_bench.compare(results, baseline, 0.1)), 2)
+
+    def test_hooks(self):
+        events = []
+        interpreter = gs_interpreter.Interpreter("{)}:f; 1 f 'a'print")
+        interpreter.add_hook("operator", lambda i, name, function: events.append(("operator", function.__name__)))
+        interpreter.add_hook("push_frame", lambda i, frame: events.append(("push", str(frame))))
+        interpreter.add_hook("pop_frame", lambda i, frame: events.append(("pop", str(frame))))
+        interpreter.add_hook("assign", lambda i, name, value: events.append(("assign", name, str(value))))
+        interpreter.add_hook("print", lambda i, value: events.append(("print", value)))
+        interpreter.output = gs_output.capture()
+        self.assertEqual(interpreter.execute(), [2])
+
+        self.assertEqual(events, [
+            ("operator", "op_asn"), ("assign", "f", "{)}"), ("operator", "op_pop"),
+            ("push", "{)}"), ("operator", "op_inc"), ("pop", "{)}"),
+            ("operator", "op_print"), ("print", "a"), ("pop", "{{)}:f; 1 f 'a'print}"),
+        ])
+
+        instructions = []
+        hook = lambda i, item: instructions.append(str(item))
+        interpreter = gs_interpreter.Interpreter("1 2+")
+        interpreter.add_hook("instruction", hook)
+        interpreter.run(max_steps=3)
+        interpreter.remove_hook("instruction", hook)
+        self.assertEqual(interpreter.hooks, {})
+        interpreter.execute()
+        self.assertEqual(instructions, ["1", " ", "2"])
+        self.assertRaises(ValueError, interpreter.add_hook, "bad", hook)
+
+    def memoised(self, text, memo):
+        interpreter = gs_interpreter.Interpreter(text, output=gs_output.capture())
+        memo.attach(interpreter)
+        return interpreter.execute()
+
+    def test_memo(self):
+        memo = gs_memo.Memo()
+        self.assertEqual(self.memoised("{.2<{}{.(f\\((f+}if}:f; 60f", memo), [1548008755920])
+        self.assertEqual((memo.hits, memo.misses), (58, 61))
+
+        for text in ["{1$+}:f; 1 2 f 1 2 f", "{2$}:c; 1 2 3 c 1 2 3 c 0 c", "{\\}:s; 1 2 s 1 2 s", "{{2*}%}:d; [1 2]d [1 2]d", "{;}:p; 1 2 p 2 p"]:
+            memo = gs_memo.Memo()
+            self.assertEqual(self.memoised(text, memo), gs_interpreter.Interpreter(text).execute())
+            self.assertGreater(memo.hits, 0)
+
+        memo = gs_memo.Memo()
+        self.assertEqual(self.memoised("{1 print}:g; g g {rand}:r; 1 r 1 r", memo), [0, 0])
+        self.assertEqual((memo.hits, memo.misses), (0, 0))
+
+        memo = gs_memo.Memo()
+        self.memoised("{1 print}:g; {g}:f; f f", memo)
+        self.assertEqual((memo.hits, memo.misses, len(memo.cache)), (0, 1, 0))
+
+        memo = gs_memo.Memo(maxsize=2)
+        self.memoised("{)}:f; 1f 2f 3f 1f", memo)
+        self.assertEqual((memo.hits, len(memo.cache)), (0, 2))
+
+    def test_tail_calls(self):
+        limits = gs_interpreter.Limits(max_call_depth=20)
+        for text in ["{.{(f}{;}if}:f; 10000f", "{.{(f }{;}if }:f;\n10000f\n", "{(.{f}{;}if}:f; 10000f"]:
+            interpreter = gs_interpreter.Interpreter(text, limits=limits)
+            self.assertEqual(interpreter.execute(), [])
+            self.assertEqual(len(interpreter.call_stack), 0)
+
+        self.check("{.{(.f}{;}if}:f; 3f", [2,1,0])
+        interpreter = gs_interpreter.Interpreter("{.{(f 1}{;}if}:f; 100f", limits=limits)
+        self.assertRaises(gs_interpreter.LimitExceeded, interpreter.execute)
+
+        interpreter = gs_interpreter.Interpreter("{.{(f}{;}if}:f; 100f", limits=limits)
+        interpreter.add_hook("push_frame", lambda interpreter, frame: None)
+        self.assertRaises(gs_interpreter.LimitExceeded, interpreter.execute)
+
+    def test_debugger_tail_calls(self):
+        class Server:
+            def send_msg(self, message):
+                pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + "/tail.gs"
+            with open(path, "w") as f:
+                f.write("{1+}:f;1f")
+
+            debugger = gs_server.Debugger(Server())
+            debugger.launch(dap_events.Command({"seq": 1, "command": "launch", "arguments": {"script": path}}))
+
+        interpreter = debugger.interpreter
+        for _ in range(4):
+            interpreter.execute_instruction()
+        debugger.next(dap_events.Command({"seq": 2, "command": "next"}))
+        self.assertEqual(interpreter.stack[:interpreter.sp+1], [2])
+        self.assertEqual(str(interpreter.call_stack[-1]), "{{1+}:f;1f}")
+
+    def check_optimised(self, text):
+        optimised = gs_interpreter.Interpreter(text, optimise=True).execute()
+        self.assertEqual(optimised, gs_interpreter.Interpreter(text).execute())
+        return optimised
+
+    def test_optimise(self):
+        for text in ["1 2+", "1 2+3*", "5 ( ) ~ 0!", "1 2 .;", "1 2\\\\", "1 ;'a';", "[1 2]1+", "'ab' 1+ 2-",
+                     "[1 2]{1+}%", "3000,{7%}%{+}*", "{1 2+}:f; f f", "3 2/ 7 2% 1 0="]:
+            self.check_optimised(text)
+
+        self.assertEqual(self.check_optimised("{-}:+; 5 1 2+"), [5, -1])
+        self.assertEqual(self.check_optimised("{1 2+}:f; {-}:+; f"), [-1])
+        self.assertEqual(self.check_optimised("5:1 2+ 1"), [7, 5])
+        self.assertEqual(self.check_optimised("{-1}:;; 1 2 .;")[-4:], [1, 2, 2, -1])
+        self.assertRaises(ZeroDivisionError, gs_interpreter.Interpreter("5 0/", optimise=True).execute)
+
+        plain = CodeBlock("1 2 + 3*;")
+        optimised = CodeBlock("1 2 + 3*;", optimise=True)
+        self.assertEqual(len(optimised.instructions), 1)
+        self.assertLess(len(optimised.instructions), len(plain.instructions))
+        self.assertEqual(optimised.instructions_index, [(0, 9)])
+
+        memo = gs_memo.Memo()
+        interpreter = gs_interpreter.Interpreter("{1+}:f; 1f 1f", optimise=True)
+        memo.attach(interpreter)
+        self.assertEqual(interpreter.execute(), [2, 2])
+        self.assertEqual(memo.hits, 1)
+
+    def test_run(self):
+        interpreter = gs_interpreter.Interpreter("1 2 3 4")
+        self.assertEqual(interpreter.run(max_steps=3), "steps")
+        self.assertEqual(interpreter.stack[:interpreter.sp+1], [1,2])
+
+        interpreter.breakpoints = {6}
+        self.assertEqual(interpreter.run(), "breakpoint")
+        self.assertEqual(interpreter.stack[:interpreter.sp+1], [1,2,3])
+
+        self.assertEqual(interpreter.run(until=lambda i: i.sp == 10), "done")
+        self.assertEqual(interpreter.stack[:interpreter.sp+1], [1,2,3,4])
+        self.assertEqual(interpreter.steps, 8)
+
     def test_op_dup(self):
         self.check("1 2 3.", [1,2,3,3])
 
@@ -156,7 +578,21 @@ class TestInterpreter(unittest.TestCase):
 
     def test_op_base(self):
         self.check("[1 1 0] 2 base", 6)
-        #self.check("6 2 base", [1 1 0])
+        self.check("6 2 base", [1,1,0])
+        self.check("2 [1 1 0] base", 6)
+        self.check("0 2 base", [])
+        self.check("-5 2 base", [1,0,1])
+        self.check("123456789 1000 base", [123,456,789])
+        self.check("[1 2 3] 1000 base", 1002003)
+        self.check("10,10 base", 123456789)
+        self.check("'AB' 256 base", 16706)
+        self.assertRaises(ValueError, self.check, "5 1 base", None)
+
+        n = 7 ** 12000
+        self.check("1{7*}12000* 7 base 7 base", n)
+        digits = gs_interpreter.Interpreter("1{7*}12000* 10 base").execute()[0]
+        self.assertEqual(len(digits), 10142)
+        self.assertEqual((digits[0], digits[-1]), (n // 10 ** (len(digits) - 1), n % 10))
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
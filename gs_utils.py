@@ -1,4 +1,6 @@
+import sys
 import gs_codeblock
+import gs_values
 import json
 
 #Same as 'str1'.join(['1','2','3']) but for lists
@@ -24,16 +26,18 @@ def convert_str_list(s):
     return new_list
 
 def to_string(v : list):
+    parts = []
+    append_string(parts, v)
+    return ''.join(parts)
 
-    if isinstance(v, list):
-        s = ""
+def append_string(parts : list, v):
+    if isinstance(v, list) or isinstance(v, gs_values.Lazy) and v.concrete is list:
         for x in v:
-            s += to_string(x)
-
-        return s
-
+            append_string(parts, x)
+    elif isinstance(v, gs_values.Rope):
+        parts.extend(v.chunks())
     else:
-        return str(v)
+        parts.append(str(v))
 
 def list_div(l : list, i : int):
     result = []
@@ -48,4 +52,145 @@ def list_div(l : list, i : int):
     if arr != []:
         result.append(arr)
 
-    return result
\ No newline at end of file
+    return result
+
+#Digits converted with a plain loop, larger numbers are split in half
+#around a power of the base so the big multiplications and divisions are
+#done by Python on halves instead of a digit at a time
+BASE_LEAF = 32
+
+#The number written by digits in base, most significant first. Digits can
+#be any int, even outside the base
+def from_digits(digits, base):
+    values = []
+    for end in range(len(digits), 0, -BASE_LEAF):
+        value = 0
+        for d in digits[max(0, end - BASE_LEAF):end]:
+            value = value * base + d
+        values.append(value)
+
+    #values are least significant first, combine them in pairs
+    power = base ** BASE_LEAF
+    while len(values) > 1:
+        values = [values[i] + values[i+1] * power if i + 1 < len(values) else values[i]
+                  for i in range(0, len(values), 2)]
+        power *= power
+
+    return values[0] if values else 0
+
+#The digits of n in base, most significant first. Like GolfScript a
+#negative number gives the digits of its absolute value, and 0 gives none
+def to_digits(n, base):
+    if base < 2:
+        raise ValueError("base must be at least 2")
+    n = abs(n)
+    if n == 0:
+        return []
+
+    powers = [base ** BASE_LEAF]
+    while powers[-1] * powers[-1] <= n:
+        powers.append(powers[-1] * powers[-1])
+
+    digits = []
+    split_digits(digits, n, base, powers, len(powers) - 1, False)
+    return digits
+
+#Append the digits of n, a number below powers[level]**2, padding them to
+#the full width when it is not the leading part
+def split_digits(digits, n, base, powers, level, pad):
+    if level < 0:
+        leaf = []
+        while n:
+            n, d = divmod(n, base)
+            leaf.append(d)
+        if pad:
+            leaf.extend([0] * (BASE_LEAF - len(leaf)))
+        digits.extend(reversed(leaf))
+        return
+
+    high, low = divmod(n, powers[level])
+    if high or pad:
+        split_digits(digits, high, base, powers, level - 1, pad)
+        split_digits(digits, low, base, powers, level - 1, True)
+    else:
+        split_digits(digits, low, base, powers, level - 1, False)
+
+#Hashable stand in for a value, lists and blocks hash by their contents
+def hash_key(v):
+    if isinstance(v, int) or isinstance(v, str):
+        return v
+    elif isinstance(v, gs_values.Lazy) and v.concrete is str:
+        return v.materialise()
+    elif isinstance(v, gs_codeblock.CodeBlock):
+        return (gs_codeblock.CodeBlock, tuple(v.tokens))
+    else:
+        return tuple(hash_key(x) for x in v)
+
+#Run a set operation on the values themselves, or on their hash keys when
+#some of them cannot be hashed
+def set_operation(fnc, list_a, list_b):
+    try:
+        return fnc(list_a, list_b, None)
+    except TypeError:
+        return fnc(list_a, list_b, hash_key)
+
+def keys(l, key):
+    if key is None:
+        return l
+    return [key(x) for x in l]
+
+def list_unique(l, key=None):
+    if key is None:
+        return list(dict.fromkeys(l))
+
+    seen = set()
+    result = []
+    for x,k in zip(l, keys(l, key)):
+        if k not in seen:
+            seen.add(k)
+            result.append(x)
+    return result
+
+#Elements of list_a that are not in list_b, duplicates are kept
+def list_difference(list_a, list_b, key=None):
+    exclude = set(keys(list_b, key))
+    return [x for x,k in zip(list_a, keys(list_a, key)) if k not in exclude]
+
+def list_union(list_a, list_b, key=None):
+    return list_unique(list(list_a) + list(list_b), key)
+
+def list_intersection(list_a, list_b, key=None):
+    include = set(keys(list_b, key))
+    return list_unique([x for x,k in zip(list_a, keys(list_a, key)) if k in include], key)
+
+def list_symmetric_difference(list_a, list_b, key=None):
+    return list_unique(list_difference(list_a, list_b, key) + list_difference(list_b, list_a, key), key)
+
+#Rough number of bytes held by a value. Long lists are measured from a
+#sample of their items so checking a big stack stays cheap
+def approx_size(v, samples=16):
+    if isinstance(v, int):
+        return sys.getsizeof(v)
+    if isinstance(v, str):
+        return 49 + len(v)
+    if isinstance(v, gs_values.Rope):
+        return 49 + len(v)
+    if isinstance(v, gs_values.Range):
+        return 48
+    if isinstance(v, gs_values.Text):
+        return 64 if v.value is None else 113 + len(v.value)
+    if isinstance(v, gs_values.Lines):
+        return 96 + 16*len(v)
+    if isinstance(v, gs_values.IntArray):
+        return 96 + v.array.nbytes
+    if isinstance(v, gs_codeblock.CodeBlock):
+        return 64 + 64*len(v.tokens)
+    return 56 + 8*len(v) + approx_items_size(v, len(v), samples)
+
+def approx_items_size(items, count, samples=16):
+    if count <= samples:
+        return sum(approx_size(items[i], samples) for i in range(count))
+
+    step = count / samples
+    sample = sum(approx_size(items[int(i*step)], samples) for i in range(samples))
+    return sample * count // samples
@@ -0,0 +1,297 @@
+import array
+import mmap
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ARRAY_THRESHOLD = 1024
+ROPE_THRESHOLD = 512
+TEXT_THRESHOLD = 1 << 20
+SCAN_BLOCK = 1 << 24
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+#Stands in for a list or string until an operator needs the real thing.
+#Sequence values can be indexed, sliced and iterated by the list operators
+#as they are, the rest are materialised when an operator asks for their type
+class Lazy:
+    concrete = list
+    sequence = True
+
+    def materialise(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.materialise())
+
+    def __getitem__(self, index):
+        return self.materialise()[index]
+
+    def __iter__(self):
+        return iter(self.materialise())
+
+    def __contains__(self, item):
+        return item in self.materialise()
+
+    def __eq__(self, other):
+        return materialise(other) == self.materialise()
+
+    #Lazy values end up inside lists, so they sort and compare with the
+    #values they stand for
+    def __lt__(self, other):
+        return self.materialise() < materialise(other)
+
+    def __gt__(self, other):
+        return self.materialise() > materialise(other)
+
+    def __le__(self, other):
+        return self.materialise() <= materialise(other)
+
+    def __ge__(self, other):
+        return self.materialise() >= materialise(other)
+
+    def __str__(self):
+        return str(self.materialise())
+
+    def __repr__(self):
+        return repr(self.materialise())
+
+def materialise(value):
+    if isinstance(value, Lazy):
+        return value.materialise()
+    return value
+
+def in_int64(*values):
+    return all(INT64_MIN <= v <= INT64_MAX for v in values)
+
+#A list of ints held in a numpy array, elements come out as Python ints
+class IntArray(Lazy):
+    def __init__(self, array):
+        self.array = array
+
+    def materialise(self):
+        return self.array.tolist()
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return IntArray(self.array[index])
+        return int(self.array[index])
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    def __contains__(self, item):
+        return type(item) is int and in_int64(item) and bool((self.array == item).any())
+
+    def bounds(self):
+        return int(self.array.min()), int(self.array.max())
+
+#The result of n, as a Python range, only turned into a list when an
+#operator needs one. Indexing, slicing and striding give back ranges
+class Range(Lazy):
+    def __init__(self, values):
+        self.values = values
+
+    def materialise(self):
+        return list(self.values)
+
+    def to_array(self):
+        return IntArray(numpy.arange(self.values.start, self.values.stop, self.values.step, dtype=numpy.int64))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Range(self.values[index])
+        return self.values[index]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __contains__(self, item):
+        return type(item) is int and item in self.values
+
+    def __eq__(self, other):
+        if isinstance(other, Range):
+            return self.values == other.values
+        return super().__eq__(other)
+
+    def sum(self):
+        if not self.values:
+            return 0
+        return len(self.values) * (self.values[0] + self.values[-1]) // 2
+
+#Use an array for long lists of ints that fit in 64 bits, anything else stays a list
+def int_array(items, threshold=ARRAY_THRESHOLD):
+    if isinstance(items, IntArray):
+        return items
+
+    if numpy is None or len(items) < threshold or len(items) == 0:
+        return None
+
+    if isinstance(items, Range):
+        if not in_int64(items.values.start, items.values.stop):
+            return None
+        return items.to_array()
+
+    if not all(type(x) is int for x in items) or not in_int64(min(items), max(items)):
+        return None
+
+    return IntArray(numpy.array(items, dtype=numpy.int64))
+
+def int_range(n):
+    return Range(range(n))
+
+#A string built by concatenation, kept as a tree of pieces so appending
+#does not copy what came before. Flattened once something needs the characters
+class Rope(Lazy):
+    concrete = str
+    sequence = False
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.length = len(left) + len(right)
+
+    def materialise(self):
+        if not (isinstance(self.left, str) and self.right == ''):
+            self.left = ''.join(self.chunks())
+            self.right = ''
+        return self.left
+
+    def chunks(self):
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, Rope):
+                nodes.append(node.right)
+                nodes.append(node.left)
+            elif node:
+                yield node
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.materialise())
+
+#Concatenate two strings, joining small pieces directly and long ones as a rope
+def concat(first, second):
+    if len(first) + len(second) < ROPE_THRESHOLD:
+        return materialise(first) + materialise(second)
+
+    if isinstance(first, Rope) and isinstance(first.right, str) and len(first.right) + len(second) < ROPE_THRESHOLD:
+        return Rope(first.left, first.right + materialise(second))
+
+    return Rope(first, second)
+
+#Input text kept as bytes, memory mapped when it comes from a file, and
+#only decoded when an operator needs the whole string. Splitting it gives
+#Lines, which decode each piece when it is used. Length is in bytes
+class Text(Lazy):
+    concrete = str
+    sequence = False
+
+    def __init__(self, data, start=0, stop=None):
+        self.data = data
+        self.start = start
+        self.stop = len(data) if stop is None else stop
+        self.value = None
+
+    def materialise(self):
+        if self.value is None:
+            self.value = decode(self.data[self.start:self.stop])
+        return self.value
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return iter(self.materialise())
+
+    #Same as str.split, dropping empty pieces if keep_empty is false
+    def split(self, separator, keep_empty=True):
+        separator = separator.encode("utf8")
+        if numpy is not None and len(separator) == 1:
+            return self.split_byte(separator[0], keep_empty)
+
+        starts = array.array("q")
+        stops = array.array("q")
+        position = self.start
+
+        while True:
+            found = self.data.find(separator, position, self.stop)
+            end = self.stop if found < 0 else found
+
+            if keep_empty or end > position:
+                starts.append(position)
+                stops.append(end)
+
+            if found < 0:
+                break
+            position = found + len(separator)
+
+        return Lines(self.data, starts, stops)
+
+    #Find a one byte separator with numpy, a block at a time
+    def split_byte(self, byte, keep_empty):
+        found = []
+        for position in range(self.start, self.stop, SCAN_BLOCK):
+            block = numpy.frombuffer(self.data, numpy.uint8, min(SCAN_BLOCK, self.stop - position), position)
+            found.append(numpy.flatnonzero(block == byte) + position)
+
+        found = numpy.concatenate(found) if found else numpy.zeros(0, numpy.int64)
+        starts = numpy.concatenate(([self.start], found + 1))
+        stops = numpy.concatenate((found, [self.stop]))
+
+        if not keep_empty:
+            keep = stops > starts
+            starts, stops = starts[keep], stops[keep]
+
+        return Lines(self.data, array.array("q", starts.astype(numpy.int64).tobytes()), array.array("q", stops.astype(numpy.int64).tobytes()))
+
+class Lines(Lazy):
+    def __init__(self, data, starts, stops):
+        self.data = data
+        self.starts = starts
+        self.stops = stops
+
+    def materialise(self):
+        return list(self)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Lines(self.data, self.starts[index], self.stops[index])
+        return decode(self.data[self.starts[index]:self.stops[index]])
+
+    def __iter__(self):
+        for start, stop in zip(self.starts, self.stops):
+            yield decode(self.data[start:stop])
+
+    def __contains__(self, item):
+        return item in iter(self)
+
+def decode(data):
+    return bytes(data).decode("utf8", errors="replace")
+
+#Read all of a binary file as a string. Large regular files are memory
+#mapped and come back as Text, anything else is read and decoded
+def read_text(f, threshold=TEXT_THRESHOLD):
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size >= threshold:
+            return Text(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    return decode(f.read())